@@ -1,274 +1,555 @@
-from flask import Flask, render_template, Response, jsonify, request
+from flask import Blueprint, Flask, render_template, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
-import cv2
-import numpy as np
 import base64
 from datetime import datetime
 import json
 import os
-import pytesseract
-from PIL import Image
-import io
+import secrets
+import sys
+import threading
 import time
-import google.generativeai as genai
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
 import requests
+from session_store import SessionIndex, create_session_store, summarize_session
+from tutoring_state import create_tutoring_state
+from caching import LRUCache, normalize_question
+from tts import AudioCache, FishAudioClient, FishAudioError, tts_pool
+from limits import CircuitBreaker, UpstreamLimiter, UpstreamOverloaded
+from metrics import metrics, span, start_profile, stop_profile, submit_profiled
+from intents import DEFAULT_RULES, IntentClassifier
+from batch_jobs import BatchJob, BatchJobs, ocr_page, prepare_page, process_pool
+from prompts import SYSTEM_INSTRUCTION, first_turn_prompt, follow_up_prompt, token_usage
+from compression import PrecompressedPage, compress_response
 
-app = Flask(__name__)
-CORS(app)
+# Routes live on a blueprint; create_app() builds the Flask app around it.
+# Heavy dependencies (google.generativeai, OpenCV, Tesseract) are imported on
+# first use, so importing this module and creating the app stay cheap.
+bp = Blueprint('tutor', __name__)
 
-# Configure Gemini
+# Gemini (the model is configured on first use, see get_model)
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash-exp')
-    print("✅ Gemini configured successfully")
-else:
-    model = None
-    print("⚠️  GEMINI_API_KEY not found - using OCR fallback only")
-
-# Configure Fish Audio API
+GEMINI_API_ENDPOINT = os.environ.get('GEMINI_API_ENDPOINT')  # e.g. a local stand-in for benchmarks
+_model = None
+_model_lock = threading.Lock()
+
+# Fish Audio (the client is created by create_app)
 FISH_AUDIO_API_KEY = os.environ.get('FISH_AUDIO_API_KEY')
-if FISH_AUDIO_API_KEY:
-    print("✅ Fish Audio API key configured")
-else:
-    print("⚠️  FISH_AUDIO_API_KEY not found - TTS will be disabled")
+tts_cache = None
+tts_client = None
+
+# Bounded concurrency for the slow upstream APIs. Requests beyond the
+# active + queued limits are rejected with 429/503 instead of piling up;
+# tutoring turns that can't get a Gemini slot are answered with OCR instead.
+# The defaults are sized from the server's thread count: together they hold
+# at most three quarters of its threads, so slow calls are turned away before
+# the server's own queue fills and the UI and session lists stay responsive.
+UPSTREAM_QUEUE_TIMEOUT = float(os.environ.get('UPSTREAM_QUEUE_TIMEOUT', '10'))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '32'))
+
+
+def upstream_limiters(threads):
+    """(gemini, tts) limiters for a server with `threads` request threads"""
+    def limit(name, sixteenths):
+        return int(os.environ.get(name, str(max(1, threads * sixteenths // 16))))
+    
+    gemini = UpstreamLimiter(
+        'gemini',
+        max_active=limit('GEMINI_MAX_CONCURRENCY', 4),
+        max_queued=limit('GEMINI_MAX_QUEUE', 4),
+        queue_timeout=UPSTREAM_QUEUE_TIMEOUT
+    )
+    tts = UpstreamLimiter(
+        'tts',
+        max_active=limit('TTS_MAX_CONCURRENCY', 2),
+        max_queued=limit('TTS_MAX_QUEUE', 2),
+        queue_timeout=UPSTREAM_QUEUE_TIMEOUT
+    )
+    return gemini, tts
+
+
+def configure_upstreams(threads):
+    """Size the upstream limiters, and the Gemini pools they admit calls to, for `threads`"""
+    global gemini_limiter, tts_limiter, gemini_pool, hedge_pool
+    gemini_limiter, tts_limiter = upstream_limiters(threads)
+    # Calls that miss their deadline keep running until the SDK times out, so
+    # leave room for them next to the admitted ones
+    gemini_pool = ThreadPoolExecutor(max_workers=gemini_limiter.max_active * 2, thread_name_prefix='gemini')
+    hedge_pool = ThreadPoolExecutor(max_workers=gemini_limiter.max_active, thread_name_prefix='hedge')
+
+
+configure_upstreams(SERVER_THREADS)
+
+# Deadlines and degradation. Gemini calls that fail or miss GEMINI_TIMEOUT
+# count against a circuit breaker; while it is open we go straight to OCR.
+# With GEMINI_HEDGE_AFTER set, OCR starts in parallel once Gemini has taken
+# that long, so a fallback answer is ready if Gemini misses its deadline.
+GEMINI_TIMEOUT = float(os.environ.get('GEMINI_TIMEOUT', '30'))
+GEMINI_HEDGE_AFTER = float(os.environ.get('GEMINI_HEDGE_AFTER', '0'))  # Seconds, 0 disables
+gemini_breaker = CircuitBreaker(
+    'gemini',
+    failure_threshold=int(os.environ.get('GEMINI_BREAKER_FAILURES', '3')),
+    reset_timeout=float(os.environ.get('GEMINI_BREAKER_RESET', '30'))
+)
+analysis_counts = Counter()
+gemini_tokens = Counter()  # Also guarded by analysis_counts_lock
+quality_counts = Counter()  # Quality gate results, same lock
+analysis_counts_lock = threading.Lock()
+
+# Image preparation before Gemini/OCR
+IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', '1600'))
+IMAGE_CROP = os.environ.get('IMAGE_CROP', '1') == '1'
+IMAGE_UPLOAD_FORMAT = os.environ.get('IMAGE_UPLOAD_FORMAT', 'jpeg')  # 'jpeg' or 'webp'
+IMAGE_UPLOAD_QUALITY = int(os.environ.get('IMAGE_UPLOAD_QUALITY', '85'))
+# Turn away dark, washed-out, blank and blurry photos before any analyzer
+# runs (thresholds: QUALITY_* in quality_gate.py)
+QUALITY_GATE = os.environ.get('QUALITY_GATE', '1') == '1'
+
+# Batch analysis jobs (see batch_jobs.py). Their Gemini calls get their own
+# small pool so a big batch can't take every slot from interactive turns.
+BATCH_MAX_PAGES = int(os.environ.get('BATCH_MAX_PAGES', '50'))
+BATCH_GEMINI_CONCURRENCY = int(os.environ.get('BATCH_GEMINI_CONCURRENCY', '2'))
+batch_jobs = BatchJobs(
+    max_jobs=int(os.environ.get('BATCH_MAX_JOBS', '100')),
+    max_running=int(os.environ.get('BATCH_MAX_RUNNING', '4'))
+)
+batch_gemini_pool = ThreadPoolExecutor(max_workers=BATCH_GEMINI_CONCURRENCY, thread_name_prefix='batch-gemini')
+
+# Repeated photos are answered from cache, keyed by an exact digest of the
+# prepared image. OCR text depends only on the image, so it is shared across
+# sessions; tutoring responses also depend on the question and the tutoring
+# state, and follow-ups on the conversation so far, so those are cached per
+# session (see gemini_cache_key).
+CACHE_TTL = int(os.environ.get('ANALYSIS_CACHE_TTL', '3600'))
+ocr_text_cache = LRUCache(
+    'ocr_text',
+    max_entries=int(os.environ.get('OCR_CACHE_SIZE', '1024')),
+    ttl=CACHE_TTL,
+    max_bytes=4 * 1024 * 1024
+)
+tutor_response_cache = LRUCache(
+    'tutor_response',
+    max_entries=int(os.environ.get('TUTOR_CACHE_SIZE', '512')),
+    ttl=CACHE_TTL,
+    max_bytes=8 * 1024 * 1024
+)
+
+# The last photo of each session, so text-only follow-ups ("I got 42, is that
+# right?") are answered against it. Only the prepared upload bytes are kept.
+session_images = LRUCache(
+    'session_image',
+    max_entries=int(os.environ.get('SESSION_IMAGE_CACHE_SIZE', '512')),
+    ttl=int(os.environ.get('SESSION_IMAGE_TTL', '1800')),
+    max_bytes=int(os.environ.get('SESSION_IMAGE_CACHE_MB', '64')) * 1024 * 1024,
+    sizeof=lambda retained: len(retained[0])
+)
+
+# Text of the clips behind /api/tts_stream/<token> URLs, see new_tts_stream_url
+tts_stream_texts = LRUCache(
+    'tts_stream_text',
+    max_entries=1024,
+    ttl=int(os.environ.get('TTS_STREAM_URL_TTL', '300')),
+    max_bytes=4 * 1024 * 1024
+)
 
 # Storage for chat sessions
 SESSIONS_FILE = 'chat_sessions.json'
-sessions = []
+SESSION_STORE = os.environ.get('SESSION_STORE', 'log')  # 'log' or 'sqlite'
+SESSION_COMPACT_EVERY = int(os.environ.get('SESSION_COMPACT_EVERY', '500'))
+session_store = None
+sessions = SessionIndex()
+
+# Per-session problem timers and hint counts ('sqlite' persists them next to
+# the session store and shares them between worker processes)
+TUTORING_STATE = os.environ.get('TUTORING_STATE', 'sqlite')  # 'sqlite' or 'memory'
+tutoring_state = None
+
+# Keyword tables for what the student is asking for (see intents.json)
+INTENT_RULES = os.environ.get('INTENT_RULES', DEFAULT_RULES)
+intent_classifier = None
 
-# Track problem start times for each session
-problem_tracking = {}
+# gzip/brotli for JSON and HTML responses; the UI page is rendered and
+# compressed once by create_app
+COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', '1') == '1'
+ui_page = None
+
+# Milliseconds spent in each create_app() step, shown on /api/stats
+startup_timings = {}
 
 def load_sessions():
     global sessions
-    if os.path.exists(SESSIONS_FILE):
-        with open(SESSIONS_FILE, 'r') as f:
-            sessions = json.load(f)
-    else:
-        sessions = []
+    sessions = SessionIndex(session_store.load())
 
 def save_sessions():
-    with open(SESSIONS_FILE, 'w') as f:
-        json.dump(sessions, f, indent=2)
+    """
+    Start folding the store's event log into a snapshot once it has grown
+    enough; the store does the work in the background and times it as the
+    `save_sessions` span
+    """
+    if session_store.needs_compaction():
+        session_store.compact(sessions.snapshot)
+
+
+def get_model():
+    """The Gemini model, configured on first use; None without an API key"""
+    global _model
+    if _model is None and GEMINI_API_KEY:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+                if GEMINI_API_ENDPOINT:
+                    genai.configure(api_key=GEMINI_API_KEY, transport='rest',
+                                    client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+                else:
+                    genai.configure(api_key=GEMINI_API_KEY)
+                _model = genai.GenerativeModel('gemini-2.0-flash-exp', system_instruction=SYSTEM_INSTRUCTION)
+    return _model
+
+
+def warm_up():
+    """Load the lazily imported dependencies and run each once"""
+    start = time.perf_counter()
+    import numpy as np
+    import cv2
+    from image_pipeline import DecodedImage
+    import ocr
+    import quality_gate
+    
+    ok, encoded = cv2.imencode('.jpg', np.full((64, 64, 3), 255, np.uint8))
+    image = DecodedImage(encoded.tobytes())
+    quality_gate.check(image.frame)
+    image.prepare(IMAGE_MAX_EDGE, IMAGE_CROP, IMAGE_UPLOAD_FORMAT, IMAGE_UPLOAD_QUALITY)
+    for name in ocr.DEFAULT_VARIANTS:
+        ocr.OCR_VARIANTS[name](image.gray)
+    get_model()
+    print(f"🔥 Warm-up done in {(time.perf_counter() - start) * 1000:.0f}ms")
 
-load_sessions()
+
+def create_app(warm_up_in_background=False):
+    """
+    Build the Flask app: open the stores, load sessions and register the
+    routes. With `warm_up_in_background` the heavy dependencies are loaded
+    in a background thread so the first real request doesn't pay for them.
+    """
+    global session_store, tutoring_state, tts_cache, tts_client, intent_classifier, ui_page
+    
+    @contextmanager
+    def step(name):
+        start = time.perf_counter()
+        yield
+        startup_timings[name] = round((time.perf_counter() - start) * 1000, 1)
+    
+    with step('flask'):
+        app = Flask(__name__)
+        app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', '25')) * 1024 * 1024
+        CORS(app)
+        app.register_blueprint(bp)
+    
+    if GEMINI_API_KEY:
+        print("✅ Gemini configured successfully")
+    else:
+        print("⚠️  GEMINI_API_KEY not found - using OCR fallback only")
+    
+    with step('tts'):
+        if FISH_AUDIO_API_KEY:
+            tts_cache = AudioCache(
+                os.environ.get('TTS_CACHE_DIR', 'tts_cache'),
+                disk_max_bytes=int(os.environ.get('TTS_CACHE_MAX_MB', '256')) * 1024 * 1024,
+                memory_max_bytes=int(os.environ.get('TTS_MEMORY_CACHE_MB', '32')) * 1024 * 1024
+            )
+            tts_client = FishAudioClient(FISH_AUDIO_API_KEY, tts_cache)
+            print("✅ Fish Audio API key configured")
+        else:
+            tts_cache = None
+            tts_client = None
+            print("⚠️  FISH_AUDIO_API_KEY not found - TTS will be disabled")
+    
+    with step('sessions'):
+        session_store = create_session_store(SESSION_STORE, SESSIONS_FILE, SESSION_COMPACT_EVERY)
+        load_sessions()
+    
+    with step('tutoring_state'):
+        tutoring_state = create_tutoring_state(
+            TUTORING_STATE, SESSIONS_FILE,
+            max_entries=int(os.environ.get('TUTORING_STATE_MAX_ENTRIES', '10000')),
+            ttl=int(os.environ.get('TUTORING_STATE_TTL', str(24 * 3600)))
+        )
+    
+    with step('intents'):
+        intent_classifier = IntentClassifier.from_file(INTENT_RULES)
+    
+    with step('ui_page'):
+        with app.app_context():
+            ui_page = PrecompressedPage(render_template('mobile.html').encode())
+    
+    print(f"⏱️  App created: {', '.join(f'{k} {v}ms' for k, v in startup_timings.items())}")
+    if warm_up_in_background:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+    return app
 
 
 def get_time_on_problem(session_id):
     """Calculate how long user has been working on current problem"""
-    if session_id not in problem_tracking:
-        problem_tracking[session_id] = {
-            'start_time': time.time(),
-            'hint_count': 0,
-            'problem_text': None
-        }
-        return 0
-    
-    elapsed = time.time() - problem_tracking[session_id]['start_time']
-    return elapsed
+    return tutoring_state.elapsed(session_id)
 
 
 def reset_problem_timer(session_id, problem_text=None):
     """Reset timer when starting a new problem"""
-    problem_tracking[session_id] = {
-        'start_time': time.time(),
-        'hint_count': 0,
-        'problem_text': problem_text
-    }
+    tutoring_state.reset(session_id, problem_text)
 
 
 def increment_hint_count(session_id):
     """Track how many hints given"""
-    if session_id in problem_tracking:
-        problem_tracking[session_id]['hint_count'] += 1
-        return problem_tracking[session_id]['hint_count']
-    return 0
+    return tutoring_state.increment_hints(session_id)
+
 
+def wants_hint(intents):
+    """Asking for help or stuck: the tutor's answer counts as a hint"""
+    return 'asking_for_help' in intents or 'expressing_frustration' in intents
 
-def analyze_with_gemini(image_data, question, session_id, is_first_message):
+
+def recent_history(session_id, limit=6, max_chars=300):
+    """The turns before the current message, as 'Student:/Tutor:' lines"""
+    session = sessions.get(session_id)
+    if not session:
+        return ''
+    lines = []
+    for msg in session['messages'][-limit - 1:-1]:
+        speaker = 'Student' if msg.get('role') == 'user' else 'Tutor'
+        content = " ".join(msg.get('content', '').split())
+        if len(content) > max_chars:
+            content = content[:max_chars] + '...'
+        lines.append(f"{speaker}: {content}")
+    return "\n".join(lines)
+
+
+def build_gemini_turn(question, session_id, is_first_message, new_photo=True):
+    """
+    Work out the tutoring state and the student's intent for this turn and
+    build the Gemini prompt from them. `new_photo` is False when the image
+    is the student's earlier photo, reused for a text-only follow-up.
+    """
+    # Get session context
+    time_elapsed = get_time_on_problem(session_id)
+    hint_count = tutoring_state.hint_count(session_id)
+    should_give_answer = time_elapsed > 120 or hint_count >= 3
+    
+    # Check what type of help they're asking for (only if not first message)
+    intents = frozenset()
+    if not is_first_message and question:
+        intents = intent_classifier.classify(question)
+    
+    # Only this small block changes per turn; the rules are the system instruction
+    if is_first_message:
+        prompt = first_turn_prompt(time_elapsed, hint_count, should_give_answer)
+    else:
+        history = recent_history(session_id)
+        prompt = follow_up_prompt(question, history, new_photo, time_elapsed, hint_count, should_give_answer, intents)
+    
+    return {
+        "prompt": prompt,
+        "hint_count": hint_count,
+        "should_give_answer": should_give_answer,
+        "gave_hint": wants_hint(intents)
+    }
+
+
+def finish_gemini_turn(session_id, turn):
+    """Update the hint count and problem timer once Gemini has answered"""
+    # Update hint count if we gave a hint (only if not first message)
+    if turn['gave_hint']:
+        increment_hint_count(session_id)
+    
+    # Reset timer if we gave the answer
+    if turn['should_give_answer']:
+        reset_problem_timer(session_id, None)
+
+
+def gemini_cache_key(image, question, session_id, is_first_message, turn):
+    """
+    Same photo, same question, same tutoring state and conversation -> same
+    answer. The prompt itself can't be the key: it has the seconds spent on
+    the problem. First-photo prompts have no history, so they are shared
+    across sessions: the same image file sent again in a new chat, by a
+    classmate or as a duplicate batch page hits. Follow-ups are keyed on
+    their session and its number of tutor replies, which fixes the history
+    they are sent with.
+    """
+    key = (image.digest, image.reused, normalize_question(question),
+           turn['hint_count'], turn['should_give_answer'])
+    if is_first_message:
+        return key
+    return key + (session_id, sessions.assistant_count(session_id))
+
+
+def count_analysis(method, reason=None):
+    """Count which analyzer answered, and why we fell back to OCR"""
+    with analysis_counts_lock:
+        analysis_counts[method] += 1
+        if reason:
+            analysis_counts[f"fallback_{reason}"] += 1
+
+
+def gemini_failure(reason):
+    return {"success": False, "fallback_reason": reason}
+
+
+def record_gemini_usage(response):
+    """Count the tokens Gemini reports for a call"""
+    usage = token_usage(response)
+    if usage is None:
+        return
+    prompt_tokens, cached_tokens, output_tokens = usage
+    with analysis_counts_lock:
+        gemini_tokens['calls'] += 1
+        gemini_tokens['prompt'] += prompt_tokens
+        gemini_tokens['cached'] += cached_tokens
+        gemini_tokens['output'] += output_tokens
+    for kind, count in (('prompt', prompt_tokens), ('cached', cached_tokens), ('output', output_tokens)):
+        metrics.inc('tutor_gemini_tokens_total', count, kind=kind)
+    print(f"🧮 Gemini tokens: {prompt_tokens} prompt ({cached_tokens} cached), {output_tokens} output")
+
+
+def gemini_request(prompt, image):
+    """The contents of a Gemini call: this turn's context block and the photo"""
+    part = image.gemini_part()
+    metrics.observe('tutor_payload_bytes', len(part['data']), kind='gemini_image')
+    metrics.observe('tutor_payload_bytes', len(prompt.encode()), kind='gemini_prompt')
+    return [prompt, part]
+
+
+def call_gemini(prompt, image):
+    """One Gemini Vision call with the configured deadline"""
+    response = get_model().generate_content(
+        gemini_request(prompt, image),
+        request_options={"timeout": GEMINI_TIMEOUT}
+    )
+    record_gemini_usage(response)
+    return response.text
+
+
+def analyze_with_gemini(image, question, session_id, is_first_message, on_slow=None):
     """
     Use Gemini Vision to analyze the student's work and provide tutoring.
-    This is the primary analysis method.
+    This is the primary analysis method. `image` is a DecodedImage.
+    On failure returns a result with success False and a `fallback_reason`;
+    `on_slow` is called once Gemini has taken longer than GEMINI_HEDGE_AFTER.
     """
-    if not model:
-        return None
+    if not GEMINI_API_KEY:
+        return gemini_failure('not_configured')
     
     try:
-        # Get session context
-        time_elapsed = get_time_on_problem(session_id)
-        hint_count = problem_tracking.get(session_id, {}).get('hint_count', 0)
-        should_give_answer = time_elapsed > 120 or hint_count >= 3
+        turn = build_gemini_turn(question, session_id, is_first_message, new_photo=not image.reused)
+        cache_key = gemini_cache_key(image, question, session_id, is_first_message, turn)
+        response_text = tutor_response_cache.get(cache_key)
         
-        # Check what type of help they're asking for (only if not first message)
-        asking_for_answer = False
-        expressing_frustration = False
-        asking_for_help = False
-        asking_to_check = False
-        giving_answer = False
-        
-        if not is_first_message and question:
-            question_lower = question.lower()
-            
-            # Check if they're giving an answer (numbers, "is it", "i think", etc.)
-            giving_answer = any(word in question_lower for word in [
-                'is it', 'i think', 'i got', 'my answer is', 'the answer is',
-                '=', 'equals'
-            ]) or any(char.isdigit() for char in question_lower)
+        if response_text is None:
+            if not gemini_breaker.allow():
+                print("🔌 Gemini circuit open, skipping to OCR")
+                return gemini_failure('circuit_open')
             
-            asking_for_answer = any(word in question_lower for word in [
-                'answer', 'solution', 'what is', "what's", 'tell me', 'give me', 'just tell'
-            ])
-            expressing_frustration = any(word in question_lower for word in [
-                'stuck', 'confused', "don't get", "dont get", 'frustrated', 
-                'give up', 'too hard', "can't do", "cant do", 'still stuck'
-            ])
-            asking_for_help = any(word in question_lower for word in [
-                'help', 'hint', 'clue', 'how do', 'how to', 'explain'
-            ])
-            asking_to_check = any(word in question_lower for word in [
-                'check', 'correct', 'right', 'wrong', 'grade', 'review'
-            ])
-        
-        # Build context-aware prompt for Gemini
-        if is_first_message:
-            prompt = f"""You are a Socratic math tutor helping a student learn. The student just took a photo of their work and wants help.
-
-**Session Context:**
-- This is the FIRST time you're seeing this problem
-- Time working on this problem: {int(time_elapsed)}s
-- Number of hints already given: {hint_count}
-- Should reveal answer: {'YES' if should_give_answer else 'NO'}
-
-**Default Intent (First Photo):**
-The student is implicitly asking: "Can you help me with this problem?"
-
-            """
+            # Call Gemini Vision API with the already-encoded upload bytes
+            with image.timed('gemini'):
+                deadline = time.monotonic() + GEMINI_TIMEOUT
+                future = submit_profiled(gemini_pool, call_gemini, turn['prompt'], image)
+                if on_slow and 0 < GEMINI_HEDGE_AFTER < GEMINI_TIMEOUT:
+                    done, _ = wait([future], timeout=GEMINI_HEDGE_AFTER)
+                    if not done:
+                        on_slow()
+                try:
+                    response_text = future.result(timeout=max(0, deadline - time.monotonic()))
+                except FutureTimeout:
+                    # Still queued behind hung calls: don't let it spend quota later
+                    future.cancel()
+                    gemini_breaker.record_failure()
+                    print(f"⏰ Gemini missed its {GEMINI_TIMEOUT:g}s deadline")
+                    return gemini_failure('timeout')
+                except Exception:
+                    gemini_breaker.record_failure()
+                    raise
+            gemini_breaker.record_success()
+            tutor_response_cache.set(cache_key, response_text)
         else:
-            prompt = f"""You are a Socratic math tutor helping a student learn. The student is continuing to work on a problem.
-
-**Session Context:**
-- Student follow-up: {question}
-- Time working on this problem: {int(time_elapsed)}s
-- Number of hints already given: {hint_count}
-- Should reveal answer: {'YES' if should_give_answer else 'NO'}
-
-**Student Intent:**
-- Giving an answer to check: {'YES' if giving_answer else 'NO'}
-- Asking for direct answer: {'YES' if asking_for_answer else 'NO'}
-- Expressing frustration: {'YES' if expressing_frustration else 'NO'}
-- Asking for help/hint: {'YES' if asking_for_help else 'NO'}
-- Asking to check work: {'YES' if asking_to_check else 'NO'}
-
-**Your Tutoring Approach:**
-
-1. **If should reveal answer = YES** (worked 2+ min OR 3+ hints OR very frustrated):
-   - Start with: "I can see you've been working hard on this! Let me show you the answer and we'll work backwards to understand it."
-   - Give the answer clearly: "✅ **The answer is: [ANSWER]**"
-   - Explain step-by-step how to get there
-   - Generate a similar practice problem for them to try
-   - End with encouragement to try the practice problem
-
-2. **If asking to check their work:**
-   - Acknowledge their work positively
-   - DO NOT immediately say if it is right or wrong
-   - Ask them to explain their thinking first
-   - Guide them to find their own errors if any
-
-3. **If asking for help (first time):**
-   - Give a gentle hint about what type of problem it is
-   - Ask guiding questions about the first step
-   - Encourage them to try
-   - Do not give away the answer
-
-4. **If asking for help (2nd-3rd hint):**
-   - Be more specific in your hints
-   - Break down the first step more clearly
-   - Still encourage them to do the calculation themselves
-
-5. **General inquiry:**
-   - Describe what you see in their work
-   - Ask how you can help
-   - Offer options: hint, check work, explain concept, etc.
-
-**Tone & Style:**
-- Use emoji for engagement (📝, 🤔, 💡, ✅, 🎯)
-- Be warm, encouraging, patient
-- Celebrate effort, not just correctness
-- Keep responses conversational and clear
-- Format with markdown for readability
-
-**IMPORTANT:**
-- Focus on teaching, not just giving answers
-- Build confidence through guided discovery
-- Make learning feel like a conversation, not a lecture
-
-Now analyze the image and respond appropriately:"""
-
-        # Convert base64 image to PIL Image for Gemini
-        img_data = base64.b64decode(image_data.split(',')[1])
-        pil_image = Image.open(io.BytesIO(img_data))
+            print("♻️  Serving cached Gemini response")
         
-        # Call Gemini Vision API
-        response = model.generate_content([prompt, pil_image])
-        
-        # Update hint count if we gave a hint (only if not first message)
-        if not is_first_message and (asking_for_help or expressing_frustration):
-            increment_hint_count(session_id)
-        
-        # Reset timer if we gave the answer
-        if should_give_answer:
-            reset_problem_timer(session_id, None)
+        finish_gemini_turn(session_id, turn)
         
         return {
             "success": True,
-            "response": response.text,
+            "response": response_text,
             "method": "gemini",
             "should_restart": False
         }
         
     except Exception as e:
         print(f"Gemini error: {e}")
-        return None
+        return gemini_failure('error')
 
 
-def preprocess_image_for_ocr(image):
-    """Preprocess image to improve OCR accuracy"""
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    
-    results = []
-    
-    # Try multiple preprocessing techniques
-    configs = [
-        ('original', gray),
-        ('threshold', cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]),
-        ('adaptive', cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                          cv2.THRESH_BINARY, 11, 2)),
-    ]
-    
-    for name, processed in configs:
-        text = pytesseract.image_to_string(processed, config='--psm 6')
-        if text.strip():
-            results.append((name, text.strip(), len(text.strip())))
+class GeminiUnavailable(Exception):
+    """Gemini was skipped, e.g. because its circuit breaker is open"""
+
+
+def stream_with_gemini(image, question, session_id, is_first_message):
+    """
+    Streaming variant of analyze_with_gemini: yields the response text in
+    chunks as Gemini generates it. Errors are raised to the caller.
+    """
+    turn = build_gemini_turn(question, session_id, is_first_message, new_photo=not image.reused)
+    cache_key = gemini_cache_key(image, question, session_id, is_first_message, turn)
+    response_text = tutor_response_cache.get(cache_key)
     
-    if results:
-        results.sort(key=lambda x: x[2], reverse=True)
-        return results[0][1]
+    if response_text is not None:
+        print("♻️  Serving cached Gemini response")
+        yield response_text
+    else:
+        if not gemini_breaker.allow():
+            raise GeminiUnavailable('circuit_open')
+        chunks = []
+        contents = gemini_request(turn['prompt'], image)
+        chunk = None
+        try:
+            with image.timed('gemini'):
+                for chunk in get_model().generate_content(contents, stream=True,
+                                                          request_options={"timeout": GEMINI_TIMEOUT}):
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        continue  # A chunk without text, e.g. only the finish reason
+                    chunks.append(text)
+                    yield text
+        except GeneratorExit:
+            # The client went away mid-answer, so Gemini was responding fine
+            gemini_breaker.record_success()
+            raise
+        except Exception:
+            gemini_breaker.record_failure()
+            raise
+        gemini_breaker.record_success()
+        record_gemini_usage(chunk)  # The last chunk carries the totals
+        tutor_response_cache.set(cache_key, "".join(chunks))
     
-    return ""
+    finish_gemini_turn(session_id, turn)
 
 
-def extract_text_from_image(image_data):
-    """Extract text from base64 image using OCR (fallback method)"""
+def extract_text_from_image(image):
+    """Extract text from a DecodedImage using OCR (fallback method)"""
     try:
-        img_data = base64.b64decode(image_data.split(',')[1])
-        nparr = np.frombuffer(img_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
+        if image.gray is None:
             return None
         
-        text = preprocess_image_for_ocr(frame)
+        from ocr import DEFAULT_VARIANTS, preprocess_image_for_ocr
+        
+        cache_key = (image.digest, tuple(DEFAULT_VARIANTS))
+        text = ocr_text_cache.get(cache_key)
+        if text is None:
+            with image.timed('ocr'):
+                text = preprocess_image_for_ocr(image.gray)
+            if text is not None:  # Failed runs (None) are retried next time
+                ocr_text_cache.set(cache_key, text)
+        else:
+            print("♻️  Serving cached OCR text")
         return text
         
     except Exception as e:
@@ -282,7 +563,7 @@ def generate_tutoring_response_fallback(extracted_text, question, session_id):
     This is a simplified fallback that doesn't use vision.
     """
     time_elapsed = get_time_on_problem(session_id)
-    hint_count = problem_tracking.get(session_id, {}).get('hint_count', 0)
+    hint_count = tutoring_state.hint_count(session_id)
     
     # Build response based on what we see
     response = ""
@@ -295,7 +576,7 @@ def generate_tutoring_response_fallback(extracted_text, question, session_id):
         response = f"📸 I can see your math problem:\n\n"
         response += f"**{extracted_text}**\n\n"
         
-        if question and any(word in question.lower() for word in ['help', 'hint', 'stuck']):
+        if wants_hint(intent_classifier.classify(question)):
             increment_hint_count(session_id)
             response += "💡 **Here's a hint:** Start by identifying what type of problem this is. "
             response += "What operation do you need to use?\n\n"
@@ -313,188 +594,855 @@ def generate_tutoring_response_fallback(extracted_text, question, session_id):
     return response
 
 
-def analyze_written_work(image_data, question, session_id):
+def undecodable_image_result():
+    return {
+        "success": False,
+        "response": "❌ I couldn't process that image. The file might be corrupted.\n\nPlease start a new chat and try taking another photo!",
+        "should_restart": True
+    }
+
+
+def analysis_error_result(error):
+    print(f"Analysis error: {error}")
+    return {
+        "success": False,
+        "error": str(error),
+        "response": "❌ Something went wrong processing your image.\n\nPlease start a new chat and try again!",
+        "should_restart": True
+    }
+
+
+def is_first_turn(session_id):
+    """True until the tutor has answered at least once in this session"""
+    return sessions.assistant_count(session_id) == 0
+
+
+def analyze_with_ocr(image, question, session_id, ocr_future=None):
+    """
+    OCR fallback: read the text with Tesseract and answer from a template.
+    `ocr_future` is a hedged extract_text_from_image call already under way.
+    """
+    print("📝 Using OCR fallback...")
+    extracted_text = ocr_future.result() if ocr_future else extract_text_from_image(image)
+    
+    if extracted_text and len(extracted_text.strip()) > 1:
+        response_text = generate_tutoring_response_fallback(
+            extracted_text, 
+            question, 
+            session_id
+        )
+        
+        return {
+            "success": True,
+            "response": response_text,
+            "method": "ocr",
+            "extracted_text": extracted_text,
+            "should_restart": False
+        }
+    
+    else:
+        # Couldn't read the text
+        response = "😕 I'm having trouble reading what's on the paper. "
+        response += "The image might be:\n"
+        response += "• Too blurry or out of focus\n"
+        response += "• Too far away from the camera\n"
+        response += "• Not enough lighting\n"
+        response += "• Text is too light or faint\n\n"
+        response += "💡 **Please try again:**\n"
+        response += "• Move the camera closer to the paper\n"
+        response += "• Make sure it's in focus (tap on the screen)\n"
+        response += "• Use better lighting\n"
+        response += "• Write darker/clearer\n\n"
+        response += "🔄 **Start a new chat** and take a clearer photo!"
+        
+        return {
+            "success": False,
+            "response": response,
+            "extracted_text": None,
+            "should_restart": True
+        }
+
+
+def screen_image(image):
+    """
+    Turn away photos no analyzer can use: undecodable ones, and those the
+    quality gate rejects. Returns the result to answer with, or None.
+    """
+    if image.reused:
+        return None  # Screened on the turn it was sent
+    if image.frame is None:
+        return undecodable_image_result()
+    if not QUALITY_GATE:
+        return None
+    
+    from quality_gate import check
+    
+    with image.timed('quality_gate'):
+        reason, measured = check(image.frame)
+    count_quality(reason)
+    if reason is None:
+        return None
+    
+    print(f"🚫 Quality gate rejected the photo as {reason}: {measured}")
+    return quality_rejection_result(reason)
+
+
+def count_quality(reason):
+    with analysis_counts_lock:
+        quality_counts[reason or 'passed'] += 1
+
+
+def quality_rejection_result(reason):
+    from quality_gate import FEEDBACK
+    
+    return {
+        "success": False,
+        "response": FEEDBACK[reason] + "\n\n📸 Take another photo and I'll have a look!",
+        "rejected": reason,
+        "should_restart": False
+    }
+
+
+def remember_image(session_id, image):
+    """Keep a newly sent photo for the session's text-only follow-ups"""
+    if not image.reused:
+        session_images.set(session_id, image.retain())
+
+
+def forget_image(session_id, image):
+    """
+    A newly sent photo was turned away: drop the session's earlier one too,
+    so follow-ups aren't answered against a different page
+    """
+    if not image.reused:
+        session_images.pop(session_id)
+
+
+def analyze_written_work(image, question, session_id):
     """
     Main analysis function - tries Gemini first, falls back to OCR if needed.
+    `image` is the DecodedImage shared by validation and both analyzers.
     """
     try:
-        # Decode image for basic validation
-        img_data = base64.b64decode(image_data.split(',')[1])
-        nparr = np.frombuffer(img_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
-            return {
-                "success": False,
-                "response": "❌ I couldn't process that image. The file might be corrupted.\n\nPlease start a new chat and try taking another photo!",
-                "should_restart": True
-            }
+        rejection = screen_image(image)
+        if rejection:
+            forget_image(session_id, image)
+            return rejection
         
-        # Determine if this is the first message in the session
-        session = next((s for s in sessions if s['id'] == session_id), None)
-        is_first_message = True
-        if session and len(session.get('messages', [])) > 0:
-            # Check if there are any previous assistant messages
-            assistant_messages = [m for m in session['messages'] if m.get('role') == 'assistant']
-            is_first_message = len(assistant_messages) == 0
+        # Crop to the worksheet and shrink it before any analyzer sees it
+        image.prepare(IMAGE_MAX_EDGE, IMAGE_CROP, IMAGE_UPLOAD_FORMAT, IMAGE_UPLOAD_QUALITY)
+        remember_image(session_id, image)
+        is_first_message = is_first_turn(session_id)
         
         # Try Gemini first (primary method)
-        if model:
+        ocr_future = None
+        if GEMINI_API_KEY:
+            def hedge():
+                nonlocal ocr_future
+                print(f"🐢 Gemini slower than {GEMINI_HEDGE_AFTER:g}s, starting OCR in parallel")
+                ocr_future = submit_profiled(hedge_pool, extract_text_from_image, image)
+            
             print(f"🤖 Analyzing with Gemini Vision... (first_message: {is_first_message})")
-            gemini_result = analyze_with_gemini(image_data, question, session_id, is_first_message)
+            try:
+                with gemini_limiter.slot():
+                    gemini_result = analyze_with_gemini(image, question, session_id, is_first_message,
+                                                        on_slow=hedge)
+            except UpstreamOverloaded as e:
+                print(f"🚦 {e}")
+                gemini_result = gemini_failure('overloaded')
             
             if gemini_result and gemini_result.get('success'):
                 print("✅ Gemini analysis successful")
+                count_analysis('gemini')
                 return gemini_result
             else:
                 print("⚠️  Gemini failed, falling back to OCR...")
+                count_analysis('ocr', gemini_result['fallback_reason'])
+        else:
+            count_analysis('ocr', 'not_configured')
         
         # Fallback to OCR method
-        print("📝 Using OCR fallback...")
-        extracted_text = extract_text_from_image(image_data)
-        
-        if extracted_text and len(extracted_text.strip()) > 1:
-            response_text = generate_tutoring_response_fallback(
-                extracted_text, 
-                question, 
-                session_id
-            )
-            
-            return {
-                "success": True,
-                "response": response_text,
-                "method": "ocr",
-                "extracted_text": extracted_text,
-                "should_restart": False
-            }
+        return analyze_with_ocr(image, question, session_id, ocr_future)
         
+    except Exception as e:
+        return analysis_error_result(e)
+    finally:
+        print(f"⏱️  Image timings: {image.timing_summary()}")
+
+
+def stream_written_work(image, question, session_id):
+    """
+    Streaming variant of analyze_written_work. Yields ('delta', text) while
+    Gemini generates its answer, then ('done', result). Responses that are not
+    streamed (OCR fallback, errors) arrive as one ('replace', text).
+    """
+    try:
+        result = screen_image(image)
+        if result is not None:
+            forget_image(session_id, image)
         else:
-            # Couldn't read the text
-            response = "😕 I'm having trouble reading what's on the paper. "
-            response += "The image might be:\n"
-            response += "• Too blurry or out of focus\n"
-            response += "• Too far away from the camera\n"
-            response += "• Not enough lighting\n"
-            response += "• Text is too light or faint\n\n"
-            response += "💡 **Please try again:**\n"
-            response += "• Move the camera closer to the paper\n"
-            response += "• Make sure it's in focus (tap on the screen)\n"
-            response += "• Use better lighting\n"
-            response += "• Write darker/clearer\n\n"
-            response += "🔄 **Start a new chat** and take a clearer photo!"
+            image.prepare(IMAGE_MAX_EDGE, IMAGE_CROP, IMAGE_UPLOAD_FORMAT, IMAGE_UPLOAD_QUALITY)
+            remember_image(session_id, image)
+            is_first_message = is_first_turn(session_id)
             
-            return {
-                "success": False,
-                "response": response,
-                "extracted_text": None,
-                "should_restart": True
-            }
-        
+            if GEMINI_API_KEY:
+                print(f"🤖 Streaming from Gemini Vision... (first_message: {is_first_message})")
+                chunks = []
+                try:
+                    with gemini_limiter.slot():
+                        for text in stream_with_gemini(image, question, session_id, is_first_message):
+                            chunks.append(text)
+                            yield 'delta', text
+                    print("✅ Gemini stream complete")
+                    count_analysis('gemini')
+                    yield 'done', {
+                        "success": True,
+                        "response": "".join(chunks),
+                        "method": "gemini",
+                        "should_restart": False
+                    }
+                    return
+                except UpstreamOverloaded as e:
+                    print(f"🚦 {e}, skipping to OCR")
+                    count_analysis('ocr', 'overloaded')
+                except GeminiUnavailable as e:
+                    print("🔌 Gemini circuit open, skipping to OCR")
+                    count_analysis('ocr', str(e))
+                except Exception as e:
+                    print(f"Gemini error: {e}")
+                    print("⚠️  Gemini failed, falling back to OCR...")
+                    count_analysis('ocr', 'error')
+            else:
+                count_analysis('ocr', 'not_configured')
+            
+            result = analyze_with_ocr(image, question, session_id)
     except Exception as e:
-        print(f"Analysis error: {e}")
-        return {
-            "success": False,
-            "error": str(e),
-            "response": "❌ Something went wrong processing your image.\n\nPlease start a new chat and try again!",
-            "should_restart": True
-        }
+        result = analysis_error_result(e)
+    finally:
+        print(f"⏱️  Image timings: {image.timing_summary()}")
+    
+    yield 'replace', result['response']
+    yield 'done', result
+
+
+@bp.app_errorhandler(UpstreamOverloaded)
+def upstream_overloaded(e):
+    print(f"🚦 {e}")
+    response = jsonify({"error": str(e), "retry_after": e.retry_after})
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, e.status_code
+
+
+@bp.before_app_request
+def begin_request_metrics():
+    g.request_start = time.perf_counter()
+    # Opt-in profiling: the response gets a Server-Timing header
+    if request.headers.get('X-Profile'):
+        start_profile()
+
+
+@bp.after_app_request
+def finish_request_metrics(response):
+    elapsed = time.perf_counter() - g.request_start
+    metrics.observe('tutor_request_seconds', elapsed, endpoint=request.endpoint or 'unknown')
+    server_timing = stop_profile()
+    if server_timing is not None:
+        total = f"total;dur={elapsed * 1000:.1f}"
+        response.headers['Server-Timing'] = f"{server_timing}, {total}" if server_timing else total
+    return response
+
+
+@bp.after_app_request
+def compress(response):
+    # Registered after finish_request_metrics so it runs first and shows up in Server-Timing
+    if COMPRESS_RESPONSES:
+        compress_response(response, request.accept_encodings)
+    return response
+
 
+@bp.teardown_app_request
+def reset_profile(error):
+    stop_profile()
 
-@app.route('/')
+
+def collect_metrics():
+    """Export the counters kept by caches, limiters and the breaker"""
+    caches = [ocr_text_cache, tutor_response_cache, session_images]
+    for cache in caches:
+        stats = cache.stats()
+        for key in ('hits', 'misses', 'evictions'):
+            yield f'tutor_cache_{key}_total', 'counter', f"Cache {key}", {'cache': cache.name}, stats[key]
+        yield 'tutor_cache_bytes', 'gauge', "Bytes held by a cache", {'cache': cache.name}, stats['bytes']
+    if tts_cache:
+        stats = tts_cache.stats()
+        yield 'tutor_cache_hits_total', 'counter', "Cache hits", {'cache': 'tts_audio'}, stats['hits']
+        yield 'tutor_cache_misses_total', 'counter', "Cache misses", {'cache': 'tts_audio'}, stats['misses']
+        yield 'tutor_cache_hits_total', 'counter', "Cache hits", {'cache': 'tts_audio_disk'}, stats['disk_hits']
+    
+    for limiter in (gemini_limiter, tts_limiter):
+        stats = limiter.stats()
+        for key in ('active', 'waiting'):
+            yield f'tutor_upstream_{key}', 'gauge', f"Upstream calls {key}", {'upstream': limiter.name}, stats[key]
+        for key in ('admitted', 'rejected', 'timed_out'):
+            yield f'tutor_upstream_{key}_total', 'counter', f"Upstream calls {key}", {'upstream': limiter.name}, stats[key]
+    
+    breaker = gemini_breaker.stats()
+    for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN):
+        yield 'tutor_circuit_state', 'gauge', "1 for the breaker's current state", \
+            {'upstream': 'gemini', 'state': state}, int(breaker['state'] == state)
+    yield 'tutor_circuit_short_circuited_total', 'counter', "Calls skipped by an open breaker", \
+        {'upstream': 'gemini'}, breaker['short_circuited']
+    
+    with analysis_counts_lock:
+        counts = dict(analysis_counts)
+        quality = dict(quality_counts)
+    for result, value in quality.items():
+        yield 'tutor_quality_gate_total', 'counter', "Photos checked by the quality gate, by result", \
+            {'result': result}, value
+    for method in ('gemini', 'ocr'):
+        yield 'tutor_analyses_total', 'counter', "Answers by analyzer", {'method': method}, counts.get(method, 0)
+    for key, value in counts.items():
+        if key.startswith('fallback_'):
+            yield 'tutor_fallbacks_total', 'counter', "OCR fallbacks by reason", \
+                {'reason': key[len('fallback_'):]}, value
+    
+    batch = batch_jobs.stats()
+    yield 'tutor_batch_jobs_running', 'gauge', "Batch jobs in progress", {}, batch['running']
+    yield 'tutor_sessions', 'gauge', "Sessions in memory", {}, len(sessions)
+
+
+metrics.add_collector(collect_metrics)
+
+
+@bp.route('/metrics')
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/')
 def index():
-    """Serve the iPhone interface"""
-    return render_template('mobile.html')
+    """Serve the iPhone interface (pre-rendered; revalidated with its ETag)"""
+    return ui_page.response(request)
 
 
-@app.route('/api/sessions')
+@bp.route('/api/sessions')
 def get_sessions():
-    """Get all chat sessions"""
-    return jsonify({"sessions": sessions})
+    """
+    Get chat sessions.
 
+    Without parameters every session is returned in full. With
+    `view=summary` only sidebar summaries are returned, paginated with
+    `limit`/`cursor`, or - with `since=<sync token>` - only the sessions
+    that changed since that token.
+    """
+    if request.args.get('view') != 'summary':
+        return jsonify({"sessions": sessions.list()})
 
-@app.route('/api/session/<session_id>')
+    sync_token = sessions.sync_token
+    # Weak match: compress_response() weakens the ETag of compressed bodies
+    if request.if_none_match.contains_weak(sync_token):
+        response = Response(status=304)
+        response.set_etag(sync_token)
+        return response
+
+    since = request.args.get('since')
+    changes = sessions.changes_since(since) if since else None
+    if changes is not None:
+        changed, deleted = changes
+        payload = {
+            "sessions": [summarize_session(s) for s in changed],
+            "deleted": deleted,
+            "reset": False
+        }
+    else:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        result = sessions.page(request.args.get('cursor'), limit)
+        if result is None:
+            # Cursor from before a restart: start over from the newest page
+            result = sessions.page(None, limit)
+            since = True
+        page, next_cursor = result
+        payload = {
+            "sessions": [summarize_session(s) for s in page],
+            "next_cursor": next_cursor,
+            "reset": bool(since)
+        }
+    payload["sync_token"] = sync_token
+
+    response = jsonify(payload)
+    response.set_etag(sync_token)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@bp.route('/api/session/<session_id>')
 def get_session(session_id):
-    """Get a specific session"""
-    session = next((s for s in sessions if s['id'] == session_id), None)
-    if session:
+    """Get a specific session, optionally only messages[offset:offset + limit]"""
+    session = sessions.get(session_id)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
+
+    if 'offset' not in request.args and 'limit' not in request.args:
         return jsonify(session)
-    return jsonify({"error": "Session not found"}), 404
 
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    messages = session['messages']
+    partial = {k: v for k, v in session.items() if k != 'messages'}
+    partial.update({
+        "messages": messages[offset:offset + limit],
+        "offset": offset,
+        "message_count": len(messages)
+    })
+    return jsonify(partial)
 
-@app.route('/api/new_session', methods=['POST'])
-def new_session():
-    """Create a new chat session"""
+
+def create_session():
     session = {
         "id": f"session_{int(datetime.now().timestamp() * 1000)}",
         "timestamp": datetime.now().isoformat(),
         "messages": []
     }
-    sessions.insert(0, session)
+    sessions.add(session)
+    session_store.add_session(session)
     save_sessions()
-    return jsonify(session)
+    return session
 
 
-@app.route('/api/send_message', methods=['POST'])
-def send_message():
-    """Process a user message with image of written work"""
-    data = request.json
-    session_id = data.get('session_id')
-    message = data.get('message', '').strip()
-    image = data.get('image')
+@bp.route('/api/new_session', methods=['POST'])
+def new_session():
+    """Create a new chat session"""
+    return jsonify(create_session())
+
+
+def parse_message_request():
+    """
+    Read (session_id, message, image, frame_unchanged) from a send_message
+    request. `frame_unchanged` is set by the client when it skipped the
+    upload because the camera frame matches the photo it sent last.
+
+    Accepts the original JSON body with a base64 data URL, a multipart form
+    with an `image` file, or raw image bytes (application/octet-stream or
+    image/*) with session_id and message in the query string.
+    """
+    from image_pipeline import decode_data_url, from_upload
+    
+    content_type = request.mimetype
+    if content_type == 'multipart/form-data':
+        fields = request.form
+        upload = request.files.get('image')
+        image = from_upload(upload.read(), upload.mimetype) if upload else None
+    elif content_type == 'application/octet-stream' or content_type.startswith('image/'):
+        fields = request.args
+        raw = request.get_data(cache=False)
+        image = from_upload(raw, content_type) if raw else None
+    else:
+        fields = request.json
+        image = decode_data_url(fields['image']) if fields.get('image') else None
+    
+    if image is not None:
+        metrics.observe('tutor_payload_bytes', len(image.raw), kind='upload')
+    frame_unchanged = str(fields.get('frame_unchanged', '')).lower() in ('1', 'true')
+    return fields.get('session_id'), (fields.get('message') or '').strip(), image, frame_unchanged
+
+
+NO_IMAGE_RESPONSE = "Please take a photo of your work so I can help you with it!"
+
+
+def add_session_message(session, role, content, **extra):
+    """Append a message to a session and record it in the session store"""
+    message = {
+        "role": role,
+        "content": content,
+        "timestamp": datetime.now().isoformat(),
+        **extra
+    }
+    index = sessions.append_message(session, message)
+    with span('session_write'):
+        session_store.add_message(session['id'], message, index)
+    return message
+
+
+def begin_message_turn():
+    """
+    Parse and validate a send_message request.
+    Returns (error_response, session, message, image); error_response is
+    None when the request is valid.
+    """
+    from image_pipeline import from_retained
+    
+    session_id, message, image, frame_unchanged = parse_message_request()
     
     if not session_id:
-        return jsonify({"error": "Missing session_id"}), 400
+        return (jsonify({"error": "Missing session_id"}), 400), None, None, None
     
-    session = next((s for s in sessions if s['id'] == session_id), None)
+    session = sessions.get(session_id)
     if not session:
-        return jsonify({"error": "Session not found"}), 404
+        return (jsonify({"error": "Session not found"}), 404), None, None, None
     
     # If no message provided but image exists, use default prompt
     if not message and image:
         message = "Can you help me with this?"
     
     if not message:
-        return jsonify({"error": "Missing message"}), 400
+        return (jsonify({"error": "Missing message"}), 400), None, None, None
     
-    # Add user message
-    user_msg = {
-        "role": "user",
-        "content": message,
-        "timestamp": datetime.now().isoformat(),
-        "has_image": image is not None
-    }
-    session['messages'].append(user_msg)
-    
-    # Analyze the written work if image provided
-    should_restart = False
-    if image:
-        result = analyze_written_work(image, message, session_id)
-        response_text = result['response']
-        should_restart = result.get('should_restart', False)
+    # Text-only follow-up: answer against the last photo of this session
+    if image is None:
+        retained = session_images.get(session_id)
+        if retained:
+            image = from_retained(retained)
+        elif frame_unchanged:
+            # The client skipped the upload but we no longer have the photo
+            return (jsonify({"error": "image_required"}), 409), None, None, None
+    
+    return None, session, message, image
+
+
+@bp.route('/api/send_message', methods=['POST'])
+def send_message():
+    """
+    Process a user message with image of written work.
+
+    Returns the whole session, or with `view=message` in the query string
+    just the new assistant message.
+    """
+    error, session, message, image = begin_message_turn()
+    if error:
+        return error
+    
+    # One turn at a time per session so messages and replies stay paired
+    with sessions.session_lock(session['id']):
+        add_session_message(session, "user", message, has_image=image is not None and not image.reused)
+        
+        # Analyze the written work if image provided
+        should_restart = False
+        if image:
+            result = analyze_written_work(image, message, session['id'])
+            response_text = result['response']
+            should_restart = result.get('should_restart', False)
+        else:
+            response_text = NO_IMAGE_RESPONSE
+        
+        # Add assistant response
+        reply = add_session_message(session, "assistant", response_text)
+        
+        save_sessions()
+        
+        if request.args.get('view') == 'message':
+            return jsonify({
+                "message": reply,
+                "success": True,
+                "should_restart": should_restart
+            })
+        return jsonify({
+            "session": session,
+            "success": True,
+            "should_restart": should_restart
+        })
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@bp.route('/api/send_message_stream', methods=['POST'])
+def send_message_stream():
+    """
+    Streaming variant of send_message using Server-Sent Events.
+
+    Emits `user` (the saved user message), then `delta` events with the
+    tutor's response text as Gemini generates it (or a single `replace` with
+    the full text when the answer is not streamed), and finally `done` with
+    the saved assistant message.
+    """
+    error, session, message, image = begin_message_turn()
+    if error:
+        return error
+    
+    # The session lock is held until the stream has been fully sent (or
+    # abandoned); a Gemini slot only while Gemini is answering
+    session_lock = sessions.session_lock(session['id'])
+    session_lock.acquire()
+    
+    released = False
+    
+    def release():
+        # Runs when the generator finishes and again when the response is
+        # closed; whichever comes first frees the session for the next turn
+        nonlocal released
+        if not released:
+            released = True
+            session_lock.release()
+    
+    try:
+        user_msg = add_session_message(session, "user", message, has_image=image is not None and not image.reused)
+    except Exception:
+        release()
+        raise
+    
+    def generate():
+        yield sse_event('user', user_msg)
+        
+        chunks = []
+        result = {"should_restart": False}
+        saved = False
+        try:
+            if image:
+                for kind, value in stream_written_work(image, message, session['id']):
+                    if kind == 'done':
+                        result = value
+                    elif kind == 'delta':
+                        chunks.append(value)
+                        yield sse_event('delta', {"text": value})
+                    else:
+                        chunks = [value]
+                        yield sse_event('replace', {"text": value})
+            else:
+                chunks = [NO_IMAGE_RESPONSE]
+                yield sse_event('replace', {"text": NO_IMAGE_RESPONSE})
+            
+            assistant_msg = add_session_message(session, "assistant", "".join(chunks))
+            saved = True
+            save_sessions()
+            
+            # `success` and `rejected` tell the client whether its photo was
+            # usable, i.e. whether follow-ups may skip re-sending it
+            yield sse_event('done', {
+                "message": assistant_msg,
+                "success": result.get('success', True),
+                "rejected": result.get('rejected'),
+                "should_restart": result.get('should_restart', False)
+            })
+        finally:
+            # Client went away mid-stream - keep whatever was generated
+            if not saved and chunks:
+                add_session_message(session, "assistant", "".join(chunks))
+                save_sessions()
+            release()
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    response.call_on_close(release)
+    return response
+
+
+def record_batch_result(job, index, result):
+    """Save one page's answer to the job's session and report it to the job"""
+    filename = job.filenames[index]
+    page = f"📄 Page {index + 1}/{job.total}" + (f" ({filename})" if filename else "")
+    if result.get('success'):
+        status = 'done'
     else:
-        response_text = "Please take a photo of your work so I can help you with it!"
+        status = 'rejected' if result.get('rejected') else 'failed'
+    try:
+        session = sessions.get(job.session_id)
+        if session:  # Unless it was deleted while the job ran
+            with sessions.session_lock(job.session_id):
+                add_session_message(session, "user", f"{page}: {job.question}", has_image=True)
+                add_session_message(session, "assistant", result['response'])
+            save_sessions()
+    finally:
+        # Reported even if saving failed, so the job still finishes
+        job.add_result({
+            "page": index + 1,
+            "filename": filename,
+            "status": status,
+            "method": result.get('method'),
+            "rejected": result.get('rejected'),
+            "response": result['response']
+        })
+
+
+def advance_batch_page(job, stage, index, image, future):
+    """
+    Handle a finished stage of one page: record its answer, or return the
+    next stage as (future, stage, image).
+    """
+    if stage == 'prepare':
+        outcome = future.result()
+        if 'error' in outcome:
+            return record_batch_result(job, index, undecodable_image_result())
+        if QUALITY_GATE:
+            count_quality(outcome.get('rejected'))
+        if 'rejected' in outcome:
+            return record_batch_result(job, index, quality_rejection_result(outcome['rejected']))
+        
+        from image_pipeline import from_retained
+        
+        image = from_retained(outcome['retained'])
+        if GEMINI_API_KEY:
+            # Every page is a new problem, so it gets a first-photo prompt
+            gemini = batch_gemini_pool.submit(analyze_with_gemini, image, job.question, job.session_id, True)
+            return gemini, 'gemini', image
+        count_analysis('ocr', 'not_configured')
+    
+    elif stage == 'gemini':
+        result = future.result()
+        if result.get('success'):
+            count_analysis('gemini')
+            return record_batch_result(job, index, result)
+        count_analysis('ocr', result['fallback_reason'])
     
-    # Add assistant response
-    assistant_msg = {
-        "role": "assistant",
-        "content": response_text,
-        "timestamp": datetime.now().isoformat()
+    else:
+        return record_batch_result(job, index, analyze_with_ocr(image, job.question, job.session_id, future))
+    
+    return process_pool().submit(ocr_page, image.retain()), 'ocr', image
+
+
+def run_batch_job(job, pages):
+    """
+    Drive every page of a job through prepare -> Gemini -> OCR fallback.
+    The stages run in the worker processes or the batch Gemini threads;
+    this thread only hands finished stages on and records the answers.
+    """
+    try:
+        drive_batch_pages(job, pages)
+    except Exception as e:
+        # Every page must get an answer: an unfinished job holds one of the
+        # BATCH_MAX_RUNNING slots forever
+        for index in job.missing_pages():
+            try:
+                record_batch_result(job, index, analysis_error_result(e))
+            except Exception as record_error:
+                print(f"Batch {job.id}: couldn't save page {index + 1}: {record_error}")
+    
+    status = job.status()
+    print(f"📚 Batch {job.id} done: {status['counts']} in {status['elapsed_s']}s ({status['pages_per_s']} pages/s)")
+
+
+def drive_batch_pages(job, pages):
+    options = {
+        "max_edge": IMAGE_MAX_EDGE,
+        "crop": IMAGE_CROP,
+        "upload_format": IMAGE_UPLOAD_FORMAT,
+        "quality": IMAGE_UPLOAD_QUALITY
     }
-    session['messages'].append(assistant_msg)
+    pending = {}
+    for index, (filename, raw, mime_type) in enumerate(pages):
+        try:
+            future = process_pool().submit(prepare_page, raw, mime_type, options, QUALITY_GATE)
+        except Exception as e:
+            record_batch_result(job, index, analysis_error_result(e))
+            continue
+        pending[future] = ('prepare', index, None)
     
-    save_sessions()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            stage, index, image = pending.pop(future)
+            try:
+                step = advance_batch_page(job, stage, index, image, future)
+            except Exception as e:
+                step = None
+                record_batch_result(job, index, analysis_error_result(e))
+            if step:
+                next_future, next_stage, image = step
+                pending[next_future] = (next_stage, index, image)
+
+
+@bp.route('/api/batch', methods=['POST'])
+def start_batch():
+    """
+    Queue a stack of worksheet pages for analysis.
+
+    Multipart form: `images` (one file per page), optional `session_id`
+    (default: a new session) and `message` (asked about every page). Each
+    answer is added to the session as soon as its page is done. Returns 202
+    with the job id; follow it at /api/batch/<job_id>[/events].
+    """
+    from image_pipeline import from_upload
+    
+    uploads = request.files.getlist('images')
+    if not uploads:
+        return jsonify({"error": "No images"}), 400
+    if len(uploads) > BATCH_MAX_PAGES:
+        return jsonify({"error": f"At most {BATCH_MAX_PAGES} pages per batch"}), 413
+    
+    session_id = request.form.get('session_id')
+    if session_id and not sessions.get(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    question = (request.form.get('message') or '').strip() or "Can you help me with this?"
+    
+    pages = []
+    for upload in uploads:
+        raw = upload.read()
+        metrics.observe('tutor_payload_bytes', len(raw), kind='upload')
+        pages.append((upload.filename, raw, from_upload(raw, upload.mimetype).mime_type))
+    
+    # The session exists before the job is registered, so a failure here
+    # can't leave a running job behind
+    new_session = not session_id
+    if new_session:
+        session_id = create_session()['id']
+    job = BatchJob(session_id, question, [filename for filename, _, _ in pages])
+    try:
+        batch_jobs.add(job)  # 429 when BATCH_MAX_RUNNING jobs are already running
+    except UpstreamOverloaded:
+        if new_session:
+            discard_session(session_id)
+        raise
+    threading.Thread(target=run_batch_job, args=(job, pages), name=job.id, daemon=True).start()
+    print(f"📚 Batch {job.id}: {job.total} pages for {job.session_id}")
     
     return jsonify({
-        "session": session,
-        "success": True,
-        "should_restart": should_restart
-    })
+        "job_id": job.id,
+        "session_id": job.session_id,
+        "total": job.total,
+        "status_url": f"/api/batch/{job.id}",
+        "events_url": f"/api/batch/{job.id}/events"
+    }), 202
+
 
+@bp.route('/api/batch/<job_id>')
+def batch_status(job_id):
+    """Progress and the answers of the pages done so far"""
+    job = batch_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.status())
 
-@app.route('/api/tts', methods=['POST'])
+
+@bp.route('/api/batch/<job_id>/events')
+def batch_events(job_id):
+    """
+    Progress as Server-Sent Events: a `page` event per finished page
+    (starting with those already done), then `done` with the job summary.
+    """
+    job = batch_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    
+    def generate():
+        seen = 0
+        while True:
+            results = job.wait_for_results(seen, timeout=15)
+            for result in results:
+                seen += 1
+                yield sse_event('page', {**result, "completed": seen, "total": job.total})
+            if job.done and seen >= job.total:
+                summary = job.status()
+                del summary['results']
+                yield sse_event('done', summary)
+                return
+            if not results:
+                yield ": keep-alive\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@bp.route('/api/tts', methods=['POST'])
 def generate_tts():
     """Generate TTS audio using Fish Audio API"""
-    if not FISH_AUDIO_API_KEY:
+    if not tts_client:
         return jsonify({"error": "Fish Audio API key not configured"}), 500
     
     data = request.json
@@ -504,105 +1452,262 @@ def generate_tts():
         return jsonify({"error": "Missing text"}), 400
     
     try:
-        url = "https://api.fish.audio/v1/tts"
-        
-        # FIXED: Added 'model' header as shown in curl
-        headers = {
-            "Authorization": f"Bearer {FISH_AUDIO_API_KEY}",
-            "Content-Type": "application/json",
-            "model": "fishaudio-tts-1"  # Add the model header (check Fish Audio docs for correct model name)
-        }
-        
-        # FIXED: Updated payload structure to match curl example
-        payload = {
-            "text": text,
-            "reference_id": "8ef4a238714b45718ce04243307c57a7",  # Keep your voice ID
-            "format": "mp3",
-            "mp3_bitrate": 128,
-            "normalize": True,
-            "latency": "normal",
-            "chunk_length": 200
-        }
-        
-        # Optional: If you need custom references
-        # payload["references"] = [{"text": "reference text here"}]
-        
-        print(f"📢 TTS Request: {text[:50]}..." if len(text) > 50 else f"📢 TTS Request: {text}")
-        
-        response = requests.post(url, headers=headers, json=payload, timeout=30)
-        
-        if response.status_code == 200:
-            if len(response.content) == 0:
-                print("⚠️ Empty audio response from Fish Audio")
-                return jsonify({"error": "Empty audio response"}), 500
-            
-            print(f"✅ TTS Success: {len(response.content)} bytes")
-            print(f"🎵 First 20 bytes (hex): {response.content[:20].hex()}")
-            
-            audio_base64 = base64.b64encode(response.content).decode('utf-8')
-            return jsonify({
-                "success": True,
-                "audio": f"data:audio/mp3;base64,{audio_base64}"
-            })
-        else:
-            error_msg = f"Fish Audio API error: {response.status_code}"
-            try:
-                error_detail = response.json()
-                print(f"❌ {error_msg} - Details: {json.dumps(error_detail, indent=2)}")
-            except:
-                print(f"❌ {error_msg} - Response: {response.text}")
-            
-            return jsonify({
-                "error": error_msg,
-                "details": response.text[:500]
-            }), response.status_code
-            
+        audio = tts_clip(text)
+        audio_base64 = base64.b64encode(audio).decode('utf-8')
+        return jsonify({
+            "success": True,
+            "audio": f"data:audio/mp3;base64,{audio_base64}"
+        })
+    
+    except UpstreamOverloaded:
+        raise  # 429/503 with Retry-After, see upstream_overloaded
+    except Exception as e:
+        return tts_error_response(e)
+
+
+def tts_clip(text):
+    """
+    The whole clip for `text`. It is built from the same per-sentence cache
+    entries as the streamed audio, so a client falling back from the stream
+    to the one-shot API doesn't pay for the synthesis twice.
+    """
+    audio = tts_client.cached_clip(text)
+    if audio is None:
+        with tts_limiter.slot():
+            audio = tts_client.synthesize_clip(text, tts_pool)
+    return audio
+
+
+def tts_error_response(e):
+    """The JSON error for a failed Fish Audio call"""
+    if isinstance(e, FishAudioError):
+        return jsonify({
+            "error": str(e),
+            "details": e.details
+        }), e.status_code
+    if isinstance(e, requests.exceptions.Timeout):
+        print("⏱️ TTS timeout - request took too long")
+        return jsonify({"error": "TTS request timeout"}), 504
+    if isinstance(e, requests.exceptions.ConnectionError):
+        print(f"🔌 Connection error to Fish Audio: {e}")
+        return jsonify({"error": "Failed to connect to Fish Audio API"}), 503
+    print(f"❌ Unexpected TTS error: {e}")
+    return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/tts_stream', methods=['POST'])
+def stream_tts():
+    """
+    Stream TTS audio as raw audio/mpeg for a JSON body like /api/tts. The
+    text is split into sentences that are synthesized concurrently and sent
+    in order, so playback can start as soon as the first sentence is ready.
+    """
+    if not tts_client:
+        return jsonify({"error": "Fish Audio API key not configured"}), 500
+    
+    text = (request.json or {}).get('text', '')
+    if not text:
+        return jsonify({"error": "Missing text"}), 400
+    return tts_stream_response(text)
+
+
+@bp.route('/api/tts_stream_url', methods=['POST'])
+def new_tts_stream_url():
+    """
+    Short-lived URL that streams the audio for a JSON body like /api/tts,
+    for use as an <audio> src. The text stays on the server, out of URLs
+    and the logs and browser history they end up in.
+    """
+    if not tts_client:
+        return jsonify({"error": "Fish Audio API key not configured"}), 500
+    
+    text = (request.json or {}).get('text', '')
+    if not text:
+        return jsonify({"error": "Missing text"}), 400
+    
+    token = secrets.token_urlsafe(16)
+    tts_stream_texts.set(token, text)
+    return jsonify({"url": f"/api/tts_stream/{token}", "expires_in": tts_stream_texts.ttl})
+
+
+@bp.route('/api/tts_stream/<token>')
+def stream_tts_token(token):
+    """
+    Stream the audio for a URL from /api/tts_stream_url. Byte-range requests
+    (Safari probes every <audio src> with one) get the whole clip with range
+    support instead: it is synthesized once, and later ranges are served from
+    the audio cache without a limiter slot.
+    """
+    if not tts_client:
+        return jsonify({"error": "Fish Audio API key not configured"}), 500
+    
+    text = tts_stream_texts.get(token)
+    if text is None:
+        return jsonify({"error": "Unknown or expired audio URL"}), 404
+    if request.range is None:
+        return tts_stream_response(text)
+    
+    try:
+        audio = tts_clip(text)
+    except UpstreamOverloaded:
+        raise
+    except Exception as e:
+        return tts_error_response(e)
+    response = Response(audio, mimetype='audio/mpeg', headers={"Cache-Control": "no-cache"})
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(audio))
+
+
+def tts_stream_response(text):
+    # The slot is held until the whole clip has been streamed
+    tts_limiter.acquire()
+    chunks = tts_client.synthesize_stream(text, tts_pool)
+    try:
+        # Wait for the first sentence so errors still get a proper status code
+        first = next(chunks)
+    except StopIteration:
+        tts_limiter.release()
+        return jsonify({"error": "Empty audio response"}), 500
+    except FishAudioError as e:
+        tts_limiter.release()
+        return jsonify({"error": str(e), "details": e.details}), e.status_code
     except requests.exceptions.Timeout:
+        tts_limiter.release()
         print("⏱️ TTS timeout - request took too long")
         return jsonify({"error": "TTS request timeout"}), 504
     except requests.exceptions.ConnectionError as e:
+        tts_limiter.release()
         print(f"🔌 Connection error to Fish Audio: {e}")
         return jsonify({"error": "Failed to connect to Fish Audio API"}), 503
-    except Exception as e:
-        print(f"❌ Unexpected TTS error: {e}")
-        return jsonify({"error": str(e)}), 500
+    except Exception:
+        tts_limiter.release()
+        raise
+    
+    def generate():
+        try:
+            yield first
+            yield from chunks
+        finally:
+            chunks.close()
+    
+    response = Response(generate(), mimetype='audio/mpeg',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(tts_limiter.release)
+    return response
+
+
+def analysis_stats():
+    with analysis_counts_lock:
+        counts = dict(analysis_counts)
+    total = counts.get('gemini', 0) + counts.get('ocr', 0)
+    counts['fallback_rate'] = round(counts.get('ocr', 0) / total, 3) if total else 0.0
+    return counts
 
 
-@app.route('/api/delete_session/<session_id>', methods=['DELETE'])
+def quality_gate_stats():
+    with analysis_counts_lock:
+        counts = dict(quality_counts)
+    checked = sum(counts.values())
+    rejected = checked - counts.get('passed', 0)
+    return {
+        "enabled": QUALITY_GATE,
+        "checked": checked,
+        "rejected": {reason: n for reason, n in counts.items() if reason != 'passed'},
+        "rejection_rate": round(rejected / checked, 3) if checked else 0.0
+    }
+
+
+def gemini_token_stats():
+    with analysis_counts_lock:
+        tokens = dict(gemini_tokens)
+    if tokens.get('calls'):
+        tokens['prompt_per_call'] = round(tokens['prompt'] / tokens['calls'], 1)
+    return tokens
+
+
+@bp.route('/api/stats')
+def get_stats():
+    """Operational counters"""
+    caches = {cache.name: cache.stats() for cache in (ocr_text_cache, tutor_response_cache, session_images)}
+    if tts_cache:
+        caches['tts_audio'] = tts_cache.stats()
+    return jsonify({
+        "caches": caches,
+        "upstream": {limiter.name: limiter.stats() for limiter in (gemini_limiter, tts_limiter)},
+        "tutoring_state": tutoring_state.stats(),
+        "gemini_breaker": gemini_breaker.stats(),
+        "analysis": analysis_stats(),
+        "gemini_tokens": gemini_token_stats(),
+        "quality_gate": quality_gate_stats(),
+        "batch": batch_jobs.stats(),
+        "ui_page_bytes": ui_page.stats(),
+        "startup_ms": startup_timings
+    })
+
+
+def discard_session(session_id):
+    """Forget a session and everything kept for it"""
+    sessions.remove(session_id)
+    session_store.delete_session(session_id)
+    tutoring_state.remove(session_id)
+    session_images.pop(session_id)
+    save_sessions()
+
+
+@bp.route('/api/delete_session/<session_id>', methods=['DELETE'])
 def delete_session(session_id):
     """Delete a session"""
-    global sessions
-    sessions = [s for s in sessions if s['id'] != session_id]
-    save_sessions()
+    discard_session(session_id)
     return jsonify({"success": True})
 
 
-if __name__ == '__main__':
-    import sys
+def main():
+    """Command-line launcher: production server by default, --dev for Flask's debug server"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="AI Math Tutor server")
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '5001')))
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS,
+                        help="request threads for the production server")
+    parser.add_argument('--queue', type=int, default=int(os.environ.get('SERVER_QUEUE', '32')),
+                        help="accepted connections allowed to wait for a free thread; beyond that they get a 503")
+    parser.add_argument('--dev', action='store_true', help="use the Flask development server with debug on")
+    parser.add_argument('--insecure', action='store_true',
+                        help="start without HTTPS if cert.pem/key.pem are missing (camera won't work on iPhone)")
+    args = parser.parse_args()
     
-    if os.path.exists('cert.pem') and os.path.exists('key.pem'):
+    if args.threads != SERVER_THREADS:
+        configure_upstreams(args.threads)
+    upstream_budget = sum(l.max_active + l.max_queued for l in (gemini_limiter, tts_limiter))
+    if not args.dev and upstream_budget >= args.threads:
+        print(f"⚠️  Gemini/TTS limits allow {upstream_budget} requests but the server has {args.threads} threads;"
+              " overload will queue in the server instead of getting 429/503")
+    
+    ssl = ('cert.pem', 'key.pem') if os.path.exists('cert.pem') and os.path.exists('key.pem') else None
+    if ssl:
         print("🔐 Starting with HTTPS (SSL enabled)")
-        print("📱 Access from iPhone: https://[your-local-ip]:5001")
-        print("💻 Access from MacBook: https://localhost:5001")
-        app.run(
-            host='0.0.0.0', 
-            port=5001, 
-            ssl_context=('cert.pem', 'key.pem'),
-            debug=True, 
-            threaded=True
-        )
+        print(f"📱 Access from iPhone: https://[your-local-ip]:{args.port}")
+        print(f"💻 Access from MacBook: https://localhost:{args.port}")
+    elif args.insecure:
+        print("🚀 Starting without HTTPS...")
+        print(f"💻 Access from MacBook only: http://localhost:{args.port}")
     else:
         print("⚠️  SSL certificates not found!")
         print("🔧 Run this command first: bash setup_ssl.sh")
         print("   Or: chmod +x setup_ssl.sh && ./setup_ssl.sh")
         print("")
         print("📖 Alternative: Start without SSL (camera won't work on iPhone)")
-        response = input("Start anyway? (y/n): ")
-        
-        if response.lower() == 'y':
-            print("🚀 Starting without HTTPS...")
-            print("💻 Access from MacBook only: http://localhost:5001")
-            app.run(host='0.0.0.0', port=5001, debug=True, threaded=True)
-        else:
-            print("👋 Exiting. Run setup_ssl.sh first!")
-            sys.exit(1)
\ No newline at end of file
+        print("   python app.py --insecure")
+        sys.exit(1)
+    
+    app = create_app(warm_up_in_background=os.environ.get('WARM_UP', '1') == '1')
+    if args.dev:
+        app.run(host=args.host, port=args.port, ssl_context=ssl, debug=True, threaded=True)
+    else:
+        from serve import serve
+        print(f"🏭 Production server: {args.threads} threads, queue {args.queue}")
+        serve(app, args.host, args.port, threads=args.threads, queue_size=args.queue, ssl=ssl)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Batch analysis jobs: many worksheet pages in one request.
+
+A job's pages are decoded, quality-checked, cropped and OCR'd in a process
+pool, so that work scales with the CPU cores; Gemini calls go through a small
+thread pool in the app, which bounds the upstream concurrency. The job keeps
+its per-page results in completion order and wakes up anyone following its
+progress.
+"""
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from limits import UpstreamOverloaded
+
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', str(os.cpu_count() or 1)))
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def process_pool():
+    """
+    The shared worker processes, started on first use. They are spawned, not
+    forked, because the app process already runs threads. A pool that broke
+    because a worker died (e.g. OOM-killed on a huge page) rejects every
+    later task, so it is replaced by a fresh one.
+    """
+    global _process_pool
+    if _process_pool is None or _process_pool._broken:
+        with _process_pool_lock:
+            if _process_pool is not None and _process_pool._broken:
+                print("⚠️  Batch worker pool broke, starting a new one")
+                _process_pool.shutdown(wait=False, cancel_futures=True)
+                _process_pool = None
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=BATCH_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _process_pool
+
+
+def prepare_page(raw, mime_type, prepare_options, quality_gate=True):
+    """
+    Worker task: decode one page, run the quality gate and prepare it for
+    upload. Returns {"error": "undecodable"}, {"rejected": reason} or
+    {"retained": DecodedImage.retain() tuple}.
+    """
+    from image_pipeline import DecodedImage
+
+    image = DecodedImage(raw, mime_type)
+    if image.frame is None:
+        return {"error": "undecodable"}
+    if quality_gate:
+        from quality_gate import check
+        reason, _ = check(image.frame)
+        if reason:
+            return {"rejected": reason}
+    image.prepare(**prepare_options)
+    return {"retained": image.retain()}
+
+
+def ocr_page(retained):
+    """Worker task: OCR text of a prepared page"""
+    from image_pipeline import from_retained
+    from ocr import preprocess_image_for_ocr
+
+    gray = from_retained(retained).gray
+    return preprocess_image_for_ocr(gray) if gray is not None else None
+
+
+class BatchJob:
+    """Progress and results of one batch; safe to read from any thread"""
+
+    def __init__(self, session_id, question, filenames):
+        self.id = f"batch_{uuid.uuid4().hex[:12]}"
+        self.session_id = session_id
+        self.question = question
+        self.filenames = filenames
+        self.created = time.time()
+        self.finished = None
+        self.results = []  # In completion order
+        self._changed = threading.Condition()
+
+    @property
+    def total(self):
+        return len(self.filenames)
+
+    @property
+    def done(self):
+        return self.finished is not None
+
+    def add_result(self, result):
+        with self._changed:
+            self.results.append(result)
+            if len(self.results) == self.total:
+                self.finished = time.time()
+            self._changed.notify_all()
+
+    def missing_pages(self):
+        """Indexes of the pages that have no result yet"""
+        with self._changed:
+            recorded = {result['page'] - 1 for result in self.results}
+        return [index for index in range(self.total) if index not in recorded]
+
+    def wait_for_results(self, seen, timeout):
+        """Block until there are more than `seen` results (or the job is done); returns the new ones"""
+        with self._changed:
+            self._changed.wait_for(lambda: len(self.results) > seen or self.done, timeout)
+            return self.results[seen:]
+
+    def status(self):
+        with self._changed:
+            results = list(self.results)
+        counts = {}
+        for result in results:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        elapsed = (self.finished or time.time()) - self.created
+        return {
+            "job_id": self.id,
+            "session_id": self.session_id,
+            "state": 'done' if self.done else ('running' if results else 'queued'),
+            "total": self.total,
+            "completed": len(results),
+            "counts": counts,
+            "elapsed_s": round(elapsed, 2),
+            "pages_per_s": round(len(results) / elapsed, 2) if results and elapsed else 0.0,
+            "results": results
+        }
+
+
+class BatchJobs:
+    """
+    The most recent `max_jobs` jobs by id; the oldest finished ones are
+    forgotten first. At most `max_running` jobs run at once: each holds all
+    its pages in memory and keeps the worker processes busy.
+    """
+
+    def __init__(self, max_jobs=100, max_running=4):
+        self.max_jobs = max_jobs
+        self.max_running = max_running
+        self.rejected = 0
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        """Register a new job, or raise UpstreamOverloaded (429) if too many are running"""
+        with self._lock:
+            if sum(1 for j in self._jobs.values() if not j.done) >= self.max_running:
+                self.rejected += 1
+                raise UpstreamOverloaded('batch', 429, 30)
+            self._jobs[job.id] = job
+            for job_id in [job_id for job_id, j in self._jobs.items() if j.done]:
+                if len(self._jobs) <= self.max_jobs:
+                    break
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {
+            "jobs": len(jobs),
+            "running": sum(1 for job in jobs if not job.done),
+            "rejected": self.rejected,
+            "pages_done": sum(len(job.results) for job in jobs),
+            "workers": BATCH_WORKERS
+        }
@@ -0,0 +1,93 @@
+"""
+Compare the compiled intent classifier against the original keyword scans
+(one `any(phrase in message)` per intent plus an isdigit() pass).
+
+    python benchmarks/bench_intents.py [--messages N] [--repeat N] [--scale 1,4,16]
+
+Reports microseconds per message for each approach, and how both grow when
+the rule table is scaled up with synthetic intents (as new intents or
+languages would), and checks that both find the same intents.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intents import IntentClassifier, load_rules  # noqa: E402
+
+SAMPLE_MESSAGES = [
+    "Can you help me with this?", "Is this right?", "I got 42, is that correct?",
+    "I'm stuck on the second step", "just tell me the answer", "What's the next step?",
+    "I think x = 7", "how do I start", "I don't get it, this is too hard",
+    "Can you check my work please", "ok", "thanks!", "Why do we divide both sides?",
+    "is it 3/4 or 4/3?", "I give up", "explain fractions again", "what is a denominator",
+]
+
+
+def legacy_classifier(rules):
+    """The original scans, generalised to any rule table"""
+    tables = [(intent, [p for p in phrases if not p.isdigit()]) for intent, phrases in rules.items()]
+    digit_intents = [intent for intent, phrases in rules.items() if any(p.isdigit() for p in phrases)]
+
+    def classify(message):
+        lower = message.lower()
+        found = {intent for intent, phrases in tables if any(p in lower for p in phrases)}
+        if digit_intents and any(char.isdigit() for char in lower):
+            found.update(digit_intents)
+        return frozenset(found)
+    return classify
+
+
+def scaled_rules(rules, scale, rng):
+    """The real rules plus (scale - 1) copies of synthetic intents of similar size"""
+    scaled = dict(rules)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    for copy in range(1, scale):
+        for intent, phrases in rules.items():
+            scaled[f"{intent}_{copy}"] = [
+                "".join(rng.choice(letters) for _ in range(rng.randint(4, 10)))
+                for _ in phrases
+            ]
+    return scaled
+
+
+def time_per_message(classify, messages, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            classify(message)
+        runs.append((time.perf_counter() - start) / len(messages) * 1e6)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scale', default='1,4,16', help="rule table sizes, as multiples of intents.json")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    messages = [rng.choice(SAMPLE_MESSAGES) for _ in range(args.messages)]
+    rules = load_rules()
+
+    print(f"{'intents':>8}{'phrases':>9}{'legacy us':>11}{'compiled us':>13}{'speedup':>9}  agree")
+    for scale in (int(s) for s in args.scale.split(',')):
+        table = scaled_rules(rules, scale, rng)
+        legacy = legacy_classifier(table)
+        compiled = IntentClassifier(table).classify
+        agree = all(legacy(m) == compiled(m) for m in SAMPLE_MESSAGES)
+        legacy_us = time_per_message(legacy, messages, args.repeat)
+        compiled_us = time_per_message(compiled, messages, args.repeat)
+        phrases = sum(len(p) for p in table.values())
+        print(f"{len(table):>8}{phrases:>9}{legacy_us:>11.2f}{compiled_us:>13.2f}"
+              f"{legacy_us / compiled_us:>8.1f}x  {'yes' if agree else 'NO'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare the parallel, confidence-based OCR fallback against the original
+serial loop (image_to_string on each variant, longest output wins).
+
+    python benchmarks/bench_ocr.py [--images DIR] [--count N] [--repeat N]
+
+Reports wall time per image and character-level accuracy against the
+expected text for each approach.
+"""
+import argparse
+import difflib
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytesseract  # noqa: E402
+
+from benchmarks.corpus import load_corpus  # noqa: E402
+from image_pipeline import DecodedImage  # noqa: E402
+import ocr  # noqa: E402
+
+
+def serial_baseline(gray):
+    """The original preprocess_image_for_ocr loop, kept for comparison"""
+    results = []
+    for name in ('original', 'threshold', 'adaptive'):
+        text = pytesseract.image_to_string(ocr.OCR_VARIANTS[name](gray), config=ocr.TESSERACT_CONFIG)
+        if text.strip():
+            results.append((name, text.strip(), len(text.strip())))
+    if results:
+        results.sort(key=lambda x: x[2], reverse=True)
+        return results[0][1]
+    return ""
+
+
+def accuracy(expected, actual):
+    if expected is None:
+        return None
+    normalize = lambda s: "".join(s.split()).lower()
+    return difflib.SequenceMatcher(None, normalize(expected), normalize(actual)).ratio()
+
+
+def run(label, fn, samples, repeat):
+    times, scores = [], []
+    for name, raw, expected in samples:
+        image = DecodedImage(raw)
+        image.prepare()
+        gray = image.gray
+        for _ in range(repeat):
+            start = time.perf_counter()
+            text = fn(gray)
+            times.append((time.perf_counter() - start) * 1000)
+        score = accuracy(expected, text)
+        if score is not None:
+            scores.append(score)
+
+    print(f"{label:<10} mean {statistics.mean(times):8.1f}ms  "
+          f"p50 {statistics.median(times):8.1f}ms  max {max(times):8.1f}ms  "
+          f"accuracy {statistics.mean(scores) if scores else float('nan'):.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', help="directory of <name>.jpg + <name>.txt samples")
+    parser.add_argument('--count', type=int, default=10, help="synthetic samples if --images is not given")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--variants', default=",".join(ocr.DEFAULT_VARIANTS))
+    args = parser.parse_args()
+
+    samples = load_corpus(args.images, args.count)
+    variants = [v.strip() for v in args.variants.split(',') if v.strip()]
+    print(f"📊 {len(samples)} images, {args.repeat} runs each, {ocr.OCR_WORKERS} OCR workers")
+
+    run('serial', serial_baseline, samples, args.repeat)
+    run('parallel', lambda gray: ocr.preprocess_image_for_ocr(gray, variants), samples, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
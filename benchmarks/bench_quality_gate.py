@@ -0,0 +1,42 @@
+"""
+Run the quality gate over sample images and show what it measured.
+
+    python benchmarks/bench_quality_gate.py [--images DIR] [--count N]
+
+Prints each image's measurements and verdict, so the QUALITY_* thresholds
+can be checked against real photos before changing them. Every sample in
+a corpus of good photos should pass.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import load_corpus  # noqa: E402
+from image_pipeline import DecodedImage  # noqa: E402
+import quality_gate  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', help="directory of <name>.jpg samples")
+    parser.add_argument('--count', type=int, default=10, help="synthetic samples if --images is not given")
+    args = parser.parse_args()
+
+    samples = load_corpus(args.images, args.count)
+    rejected = 0
+    for name, raw, _ in samples:
+        frame = DecodedImage(raw).frame
+        start = time.perf_counter()
+        reason, measured = quality_gate.check(frame)
+        elapsed = (time.perf_counter() - start) * 1000
+        rejected += reason is not None
+        print(f"{name:<24} {reason or 'passed':<10} {elapsed:6.1f}ms  "
+              + "  ".join(f"{key} {value}" for key, value in measured.items()))
+    print(f"📊 {rejected}/{len(samples)} rejected")
+
+
+if __name__ == '__main__':
+    main()
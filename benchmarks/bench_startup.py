@@ -0,0 +1,107 @@
+"""
+Measure cold-start cost: importing app.py, create_app(), and the first
+requests a fresh worker serves.
+
+    python benchmarks/bench_startup.py [--runs N] [--sessions N] [--warm-up]
+
+Every run is a new Python process working in a scratch directory, seeded
+with --sessions synthetic chat sessions. The first image request goes
+through the OCR fallback unless GEMINI_API_KEY is set.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import io, json, sys, threading, time
+start = time.perf_counter()
+import app
+timings = {"import": time.perf_counter() - start}
+
+start = time.perf_counter()
+flask_app = app.create_app(warm_up_in_background=WARM_UP)
+timings["create_app"] = time.perf_counter() - start
+
+if WARM_UP:
+    start = time.perf_counter()
+    for thread in threading.enumerate():
+        if thread.name == 'warm-up':
+            thread.join()
+    timings["warm_up_wait"] = time.perf_counter() - start
+
+client = flask_app.test_client()
+start = time.perf_counter()
+client.get('/api/sessions?view=summary')
+timings["first_request"] = time.perf_counter() - start
+
+session_id = client.post('/api/new_session').get_json()['id']
+start = time.perf_counter()
+client.post('/api/send_message', content_type='multipart/form-data', data={
+    'session_id': session_id, 'message': 'help',
+    'image': (io.BytesIO(IMAGE), 'work.png')})
+timings["first_image_request"] = time.perf_counter() - start
+print(json.dumps({k: v * 1000 for k, v in timings.items()}))
+'''
+
+
+def seed_sessions(directory, count):
+    sessions = [{
+        "id": f"session-{i}",
+        "timestamp": "2024-01-01T00:00:00",
+        "messages": [
+            {"role": "user", "content": "Can you help me with this?", "timestamp": "2024-01-01T00:00:00", "has_image": True},
+            {"role": "assistant", "content": "Sure! " * 40, "timestamp": "2024-01-01T00:00:01"},
+        ]
+    } for i in range(count)]
+    with open(os.path.join(directory, 'chat_sessions.json'), 'w') as f:
+        json.dump(sessions, f)
+
+
+def sample_image():
+    """A small PNG written with the standard library, so the parent stays light"""
+    import struct
+    import zlib
+
+    width, height = 64, 32
+    rows = b''.join(b'\x00' + b'\xff' * width for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def run_once(warm_up, sessions):
+    with tempfile.TemporaryDirectory() as directory:
+        seed_sessions(directory, sessions)
+        code = CHILD.replace('WARM_UP', repr(warm_up)).replace('IMAGE', repr(sample_image()))
+        env = dict(os.environ, PYTHONPATH=ROOT, TTS_CACHE_DIR=os.path.join(directory, 'tts_cache'))
+        output = subprocess.run([sys.executable, '-c', code], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--sessions', type=int, default=200, help="sessions in the seeded chat_sessions.json")
+    parser.add_argument('--warm-up', action='store_true', help="warm up in the background and wait for it")
+    args = parser.parse_args()
+
+    print(f"📊 {args.runs} cold starts, {args.sessions} stored sessions, warm-up {'on' if args.warm_up else 'off'}")
+    results = [run_once(args.warm_up, args.sessions) for _ in range(args.runs)]
+    for stage in results[0]:
+        times = [r[stage] for r in results]
+        print(f"{stage:<20} mean {statistics.mean(times):8.1f}ms  "
+              f"p50 {statistics.median(times):8.1f}ms  max {max(times):8.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
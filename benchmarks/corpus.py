@@ -0,0 +1,100 @@
+"""
+Sample images of handwritten-style math for the benchmarks.
+
+Real photos can be dropped into a directory as `<name>.jpg` with the expected
+text in `<name>.txt` next to it. Without one, a synthetic corpus is rendered
+with OpenCV's script fonts, plus blur, noise, uneven lighting and a desk
+background so that the crop and OCR paths have something realistic to chew on.
+"""
+import glob
+import os
+import random
+
+import cv2
+import numpy as np
+
+EXPRESSIONS = [
+    "2x + 3 = 11",
+    "5 * 7 = 35",
+    "12 / 4 = 3",
+    "x^2 - 9 = 0",
+    "3(x - 2) = 12",
+    "48 + 17 = 65",
+    "y = 2x + 1",
+    "7 - 4 = 3",
+    "100 / 25 = 4",
+    "9x = 81",
+]
+
+# Written about 9cm wide on an A4 sheet in the single-line samples (30% of
+# the sheet's long side, which runs across the default landscape frame)
+SINGLE_LINE = "3x + 5 = 20"
+
+FONTS = [cv2.FONT_HERSHEY_SCRIPT_SIMPLEX, cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX]
+
+
+def render_sample(text, size=(3024, 4032), seed=0, text_width=None, close_up=False):
+    """
+    Render `text` on a sheet of paper lying on a desk, as a BGR frame. By
+    default the text is sized to the sheet; `text_width` is the share of
+    the sheet's width it spans instead. With `close_up` the sheet fills the
+    frame.
+    """
+    rng = random.Random(seed)
+    h, w = size
+    frame = np.full((h, w, 3), (70, 90, 110), np.uint8)
+    frame = cv2.add(frame, np.random.default_rng(seed).integers(0, 25, frame.shape, dtype=np.uint8))
+
+    x0, y0 = rng.randint(w // 10, w // 5), rng.randint(h // 10, h // 5)
+    x1, y1 = w - rng.randint(w // 10, w // 5), h - rng.randint(h // 10, h // 5)
+    if close_up:
+        x0, y0, x1, y1 = 0, 0, w, h
+    cv2.rectangle(frame, (x0, y0), (x1, y1), (238, 240, 242), -1)
+
+    font = rng.choice(FONTS)
+    scale = (x1 - x0) / 700
+    thickness = max(2, int(scale * 3))
+    (tw, th), _ = cv2.getTextSize(text, font, scale, thickness)
+    if text_width:
+        # About a 0.5mm pen stroke across the 297mm of an A4 sheet held sideways
+        thickness = max(2, round((x1 - x0) / 600))
+        scale *= text_width * (x1 - x0) / tw
+        (tw, th), _ = cv2.getTextSize(text, font, scale, thickness)
+    org = (x0 + ((x1 - x0) - tw) // 2, y0 + ((y1 - y0) + th) // 2)
+    cv2.putText(frame, text, org, font, scale, (30, 30, 40), thickness, cv2.LINE_AA)
+
+    # Uneven lighting and a little camera blur
+    gradient = np.linspace(0.75, 1.0, w, dtype=np.float32)[None, :, None]
+    frame = (frame.astype(np.float32) * gradient).astype(np.uint8)
+    return cv2.GaussianBlur(frame, (5, 5), 0)
+
+
+def synthetic_corpus(count=10, size=(3024, 4032)):
+    """
+    List of (name, jpeg_bytes, expected_text) for rendered samples. Every
+    tenth one is a close-up of a single equation written at normal size
+    (SINGLE_LINE): the most common first photo, and mostly empty paper.
+    """
+    samples = []
+    for i in range(count):
+        single_line = i % 10 == 9
+        text = SINGLE_LINE if single_line else EXPRESSIONS[i % len(EXPRESSIONS)]
+        frame = render_sample(text, size, seed=i, text_width=0.3 if single_line else None, close_up=single_line)
+        ok, encoded = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        samples.append((f"synthetic_{i}", encoded.tobytes(), text))
+    return samples
+
+
+def load_corpus(directory=None, count=10):
+    """Load `<name>.jpg` + `<name>.txt` pairs from `directory`, or render a corpus"""
+    if not directory:
+        return synthetic_corpus(count)
+
+    samples = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.jpg'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        expected_path = os.path.join(directory, f"{name}.txt")
+        expected = open(expected_path).read().strip() if os.path.exists(expected_path) else None
+        with open(path, 'rb') as f:
+            samples.append((name, f.read(), expected))
+    return samples
@@ -0,0 +1,142 @@
+"""
+Local stand-ins for the Gemini and Fish Audio APIs.
+
+Both servers run in a background thread on localhost and answer with a
+configurable latency and error rate, so the app can be load-tested without
+API keys or costs. Point the app at them with GEMINI_API_ENDPOINT and
+FISH_AUDIO_URL.
+"""
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TUTOR_REPLY = ("Nice start! 👍 You've set up the equation correctly. "
+               "What do you get if you subtract 3 from both sides? "
+               "Try that step and show me your work.")
+
+
+class FakeServer:
+    """
+    Threaded HTTP server answering POSTs after `latency` seconds (plus up to
+    `jitter` more), failing a fraction `error_rate` of them with a 500.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, port=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                server.handle(self, body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def delay(self):
+        return self.latency + random.uniform(0, self.jitter)
+
+    def handle(self, handler, body):
+        with self._lock:
+            self.calls += 1
+            failed = random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        time.sleep(self.delay())
+        if failed:
+            self.send(handler, 500, 'application/json', json.dumps({"error": "injected failure"}).encode())
+        else:
+            self.respond(handler, body)
+
+    def respond(self, handler, body):
+        raise NotImplementedError
+
+    @staticmethod
+    def send(handler, status, content_type, data):
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+class FakeGemini(FakeServer):
+    """
+    Speaks the REST flavour of the Gemini API used by google.generativeai
+    with transport='rest': generateContent returns one response, and
+    streamGenerateContent returns a JSON array sent in `stream_chunks` parts.
+    """
+
+    def __init__(self, reply=TUTOR_REPLY, stream_chunks=4, **kwargs):
+        super().__init__(**kwargs)
+        self.reply = reply
+        self.stream_chunks = stream_chunks
+
+    @staticmethod
+    def response(text):
+        return {
+            "candidates": [{
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0
+            }],
+            "usageMetadata": {"promptTokenCount": 900, "candidatesTokenCount": 40, "totalTokenCount": 940}
+        }
+
+    def respond(self, handler, body):
+        if ':streamGenerateContent' not in handler.path:
+            self.send(handler, 200, 'application/json', json.dumps(self.response(self.reply)).encode())
+            return
+
+        words = self.reply.split(' ')
+        step = max(1, len(words) // self.stream_chunks)
+        parts = [' '.join(words[i:i + step]) + ' ' for i in range(0, len(words), step)]
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+        for i, text in enumerate(parts):
+            data = ('[' if i == 0 else ',') + json.dumps(self.response(text))
+            if i == len(parts) - 1:
+                data += ']'
+            data = data.encode()
+            handler.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            handler.wfile.flush()
+            time.sleep(self.latency / 10)
+        handler.wfile.write(b"0\r\n\r\n")
+
+
+class FakeFishAudio(FakeServer):
+    """Answers every TTS request with the repository's test_audio.mp3"""
+
+    def __init__(self, audio_path=os.path.join(ROOT, 'test_audio.mp3'), **kwargs):
+        super().__init__(**kwargs)
+        with open(audio_path, 'rb') as f:
+            self.audio = f.read()
+
+    def respond(self, handler, body):
+        self.send(handler, 200, 'audio/mpeg', self.audio)
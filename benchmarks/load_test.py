@@ -0,0 +1,253 @@
+"""
+Replay a request trace against the app served by cheroot, with local fake
+Gemini and Fish Audio servers, and report throughput, latency and memory.
+
+    python benchmarks/load_test.py [--trace FILE] [--concurrency N] [--ocr]
+
+A trace is a JSONL file with one request per line:
+
+    {"op": "new_session", "session": "a"}
+    {"op": "send_message", "session": "a", "message": "Is this right?", "image": 3}
+    {"op": "send_message_stream", "session": "a", "message": "What next?", "image": 4}
+    {"op": "tts", "text": "Great job!"}
+    {"op": "sessions"}
+
+`session` refers to a session created earlier in the trace and `image` picks
+an image from the corpus (--images, or rendered samples). Requests for one
+session are replayed in order; different sessions run concurrently. Without
+--trace a synthetic trace is generated, and --write-trace saves it.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from benchmarks.corpus import load_corpus, synthetic_corpus  # noqa: E402
+from benchmarks.fakes import FakeFishAudio, FakeGemini  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+QUESTIONS = ["Can you help me with this?", "Is this right?", "What should I do next?",
+             "I'm stuck", "Did I get it?", "Can you check my answer?"]
+TTS_TEXTS = ["Great job! You solved it.", "Try subtracting 3 from both sides first.",
+             "What do you get when you divide both sides by 2?", "Nice start! Check your last step."]
+
+
+def synthetic_trace(sessions=20, turns=4, images=5, seed=0):
+    """A mixed trace: every session sends `turns` photos, with TTS and sidebar reloads"""
+    rng = random.Random(seed)
+    trace = []
+    for s in range(sessions):
+        key = f"s{s}"
+        trace.append({"op": "new_session", "session": key})
+        for turn in range(turns):
+            trace.append({
+                "op": "send_message_stream" if turn % 2 else "send_message",
+                "session": key,
+                "message": rng.choice(QUESTIONS),
+                "image": rng.randrange(images)
+            })
+            trace.append({"op": "tts", "text": rng.choice(TTS_TEXTS)})
+        trace.append({"op": "sessions"})
+    return trace
+
+
+def read_trace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def group_scripts(trace):
+    """Split the trace into per-session scripts; other requests run on their own"""
+    scripts, by_session = [], {}
+    for entry in trace:
+        key = entry.get('session')
+        if key is None:
+            scripts.append([entry])
+        elif key in by_session:
+            by_session[key].append(entry)
+        else:
+            by_session[key] = [entry]
+            scripts.append(by_session[key])
+    return scripts
+
+
+class Replayer:
+    """Runs trace scripts against `base_url` and records (label, seconds, status)"""
+
+    def __init__(self, base_url, images):
+        self.base_url = base_url
+        self.images = images
+        self.results = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def http(self):
+        if not hasattr(self._local, 'http'):
+            self._local.http = requests.Session()
+        return self._local.http
+
+    def record(self, label, seconds, status):
+        with self._lock:
+            self.results.append((label, seconds, status))
+
+    def run_script(self, script):
+        session_ids = {}
+        for entry in script:
+            try:
+                self.run_entry(entry, session_ids)
+            except requests.RequestException as e:
+                self.record(entry['op'], 0.0, type(e).__name__)
+
+    def run_entry(self, entry, session_ids):
+        op = entry['op']
+        start = time.perf_counter()
+        if op == 'new_session':
+            response = self.http.post(f"{self.base_url}/api/new_session")
+            if response.ok:
+                session_ids[entry['session']] = response.json()['id']
+        elif op == 'sessions':
+            response = self.http.get(f"{self.base_url}/api/sessions", params={"view": "summary"})
+        elif op == 'tts':
+            response = self.http.post(f"{self.base_url}/api/tts", json={"text": entry['text']})
+        elif op in ('send_message', 'send_message_stream'):
+            name, image, _ = self.images[entry.get('image', 0) % len(self.images)]
+            response = self.http.post(
+                f"{self.base_url}/api/{op}",
+                data={"session_id": session_ids.get(entry['session'], entry['session']),
+                      "message": entry.get('message', '')},
+                files={"image": (f"{name}.jpg", image, 'image/jpeg')},
+                stream=op == 'send_message_stream'
+            )
+            if op == 'send_message_stream':
+                first_text = None
+                for line in response.iter_lines():
+                    if first_text is None and line in (b'event: delta', b'event: replace'):
+                        first_text = time.perf_counter() - start
+                if first_text is not None:
+                    self.record('send_message_stream (first text)', first_text, response.status_code)
+                response.close()
+        else:
+            raise ValueError(f"Unknown trace op: {op}")
+        self.record(op, time.perf_counter() - start, response.status_code)
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted `values`"""
+    return values[min(len(values) - 1, max(0, int(round(q / 100 * len(values))) - 1))]
+
+
+def rss_mb():
+    """Peak resident set size of this process (server and clients) in MB"""
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def report(results, wall_time):
+    print(f"{'endpoint':<34}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for label in sorted({r[0] for r in results}):
+        rows = [r for r in results if r[0] == label]
+        times = sorted(r[1] * 1000 for r in rows if r[2] == 200)
+        errors = [r[2] for r in rows if r[2] != 200]
+        if times:
+            print(f"{label:<34}{len(rows):>9}{len(errors):>8}{len(rows) / wall_time:>8.1f}"
+                  f"{percentile(times, 50):>9.1f}{percentile(times, 99):>9.1f}{times[-1]:>9.1f}")
+        else:
+            print(f"{label:<34}{len(rows):>9}{len(errors):>8}")
+        if errors:
+            counts = {status: errors.count(status) for status in set(errors)}
+            print(f"{'':<34}errors: {counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--trace', help="JSONL trace to replay (default: synthetic)")
+    parser.add_argument('--write-trace', help="save the replayed trace to this file")
+    parser.add_argument('--sessions', type=int, default=20, help="sessions in the synthetic trace")
+    parser.add_argument('--turns', type=int, default=4, help="photos per session in the synthetic trace")
+    parser.add_argument('--concurrency', type=int, default=8, help="sessions replayed in parallel")
+    parser.add_argument('--threads', type=int, default=32, help="server request threads")
+    parser.add_argument('--images', help="directory of <name>.jpg + <name>.txt samples")
+    parser.add_argument('--image-count', type=int, default=5)
+    parser.add_argument('--ocr', action='store_true', help="no Gemini: answer through the OCR fallback")
+    parser.add_argument('--gemini-latency', type=float, default=1.5)
+    parser.add_argument('--gemini-jitter', type=float, default=0.5)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--tts-latency', type=float, default=0.4)
+    parser.add_argument('--tts-error-rate', type=float, default=0.0)
+    parser.add_argument('--verbose', action='store_true', help="show the app's log output")
+    args = parser.parse_args()
+
+    if args.images:
+        images = load_corpus(args.images)
+    else:
+        images = synthetic_corpus(args.image_count, size=(1440, 1080))
+    trace = read_trace(args.trace) if args.trace else synthetic_trace(args.sessions, args.turns, len(images))
+    if args.write_trace:
+        with open(args.write_trace, 'w') as f:
+            f.writelines(json.dumps(entry) + "\n" for entry in trace)
+
+    gemini = FakeGemini(latency=args.gemini_latency, jitter=args.gemini_jitter,
+                        error_rate=args.gemini_error_rate).start()
+    fish = FakeFishAudio(latency=args.tts_latency, error_rate=args.tts_error_rate).start()
+    workdir = tempfile.mkdtemp(prefix='tutor-load-')
+    os.environ.update({
+        "GEMINI_API_ENDPOINT": gemini.url,
+        "FISH_AUDIO_API_KEY": "fake",
+        "FISH_AUDIO_URL": f"{fish.url}/v1/tts",
+        "TTS_CACHE_DIR": os.path.join(workdir, 'tts_cache'),
+        "SERVER_THREADS": str(args.threads),  # Upstream limits are sized from it
+    })
+    if args.ocr:
+        os.environ.pop('GEMINI_API_KEY', None)
+    else:
+        os.environ['GEMINI_API_KEY'] = 'fake'
+    os.chdir(workdir)
+
+    from serve import make_server
+    import app as tutor_app
+
+    log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, 'w'))
+    with log:
+        flask_app = tutor_app.create_app()
+        tutor_app.warm_up()
+        server = make_server(flask_app, '127.0.0.1', 0, threads=args.threads, queue_size=args.threads * 4)
+        server.prepare()
+        threading.Thread(target=server.serve, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.bind_addr[1]}"
+
+        scripts = group_scripts(trace)
+        replayer = Replayer(base_url, images)
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(replayer.run_script, scripts))
+        wall_time = time.perf_counter() - start
+        server.stop()
+
+    print(f"📊 {len(trace)} requests in {len(scripts)} scripts, concurrency {args.concurrency}, "
+          f"{'OCR' if args.ocr else 'Gemini'} path, {wall_time:.1f}s")
+    print(f"   fake Gemini: {gemini.calls} calls ({gemini.errors} failed), "
+          f"fake Fish Audio: {fish.calls} calls ({fish.errors} failed)")
+    report(replayer.results, wall_time)
+    print(f"🧠 peak RSS {rss_mb():.0f} MB (was {rss_before:.0f} MB before the run)")
+
+
+if __name__ == '__main__':
+    main()
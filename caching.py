@@ -0,0 +1,93 @@
+"""
+In-memory caches with LRU + TTL eviction and hit/miss counters.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache. Entries expire after `ttl` seconds, and the least
+    recently used ones are evicted beyond `max_entries` or `max_bytes`
+    (measured with `sizeof`, default len()).
+    """
+
+    def __init__(self, name, max_entries=256, ttl=3600, max_bytes=None, sizeof=len):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self.bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._remove(key)
+                return entry[2]
+            return None
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+# Everything but words, spaces and math: operators, comparisons and
+# parentheses change what is being asked ("is x<3" vs "is x>3")
+_PUNCTUATION = re.compile(r"[^\w\s=+\-*/^.,<>()%!≤≥≠×÷√]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_question(question):
+    """Lowercase, drop decorative punctuation and collapse whitespace"""
+    if not question:
+        return ''
+    return _WHITESPACE.sub(' ', _PUNCTUATION.sub('', question.lower())).strip(' .')
@@ -0,0 +1,111 @@
+"""
+Response compression and the pre-compressed UI page.
+
+Text responses (JSON, HTML, ...) above a size threshold are compressed with
+brotli when the client accepts it and the optional `brotli` package is
+installed, otherwise with gzip. Streams and binary media are left alone.
+Static pages are compressed once, up front, with the highest settings.
+"""
+import gzip
+import hashlib
+import os
+
+from flask import Response
+
+from metrics import metrics, span
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', '5'))
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'image/svg+xml',
+    'text/css', 'text/html', 'text/javascript', 'text/plain',
+}
+
+
+def choose_encoding(accept_encodings, available=('br', 'gzip')):
+    """Best of `available` the client accepts, or None; brotli is preferred"""
+    for encoding in available:
+        if encoding == 'br' and brotli is None:
+            continue
+        if accept_encodings.quality(encoding) > 0:
+            return encoding
+    return None
+
+
+def compress(data, encoding, best=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress a buffered text response in place when it is big enough to be
+    worth it. A strong ETag becomes weak, since the bytes no longer match it.
+    """
+    if (response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 304)
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    data = response.get_data()
+    if encoding is None or len(data) < COMPRESS_MIN_BYTES:
+        return response
+
+    with span('compress'):
+        compressed = compress(data, encoding)
+    if len(compressed) >= len(data):
+        return response
+
+    metrics.inc('tutor_response_bytes_total', len(data), stage='uncompressed')
+    metrics.inc('tutor_response_bytes_total', len(compressed), stage='sent')
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+class PrecompressedPage:
+    """
+    A page rendered once and kept as identity, gzip and (with brotli
+    installed) br bytes, each with its own strong ETag so clients can
+    revalidate with a 304.
+    """
+
+    def __init__(self, body, mimetype='text/html'):
+        self.mimetype = mimetype
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        self.variants = {None: (body, digest)}
+        for encoding in ('br', 'gzip'):
+            if encoding == 'br' and brotli is None:
+                continue
+            self.variants[encoding] = (compress(body, encoding, best=True), f"{digest}-{encoding}")
+
+    def response(self, request):
+        encoding = choose_encoding(request.accept_encodings, [e for e in self.variants if e])
+        body, etag = self.variants[encoding]
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=self.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def stats(self):
+        return {encoding or 'identity': len(body) for encoding, (body, _) in self.variants.items()}
@@ -0,0 +1,235 @@
+"""
+Image ingest stage shared by the Gemini and OCR analyzers.
+
+An uploaded photo is decoded exactly once; every consumer reads from the same
+buffers instead of re-decoding the base64 string.
+"""
+import base64
+import binascii
+import hashlib
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from metrics import record_span
+
+
+def _sniff_mime_type(raw):
+    if raw[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if raw[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if raw[:4] == b'RIFF' and raw[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'application/octet-stream'
+
+
+def find_document_region(gray, detect_edge=512, margin=0.03):
+    """
+    Locate the worksheet (or, failing that, the handwriting) in a grayscale
+    frame. Returns (x0, y0, x1, y1) in frame coordinates, or None when
+    cropping would not remove a meaningful amount of background.
+    """
+    h, w = gray.shape[:2]
+    scale = min(1.0, detect_edge / max(h, w))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    sh, sw = small.shape[:2]
+    blurred = cv2.GaussianBlur(small, (5, 5), 0)
+
+    # A sheet of paper shows up as one large outer contour
+    region = None
+    edges = cv2.dilate(cv2.Canny(blurred, 50, 150), None, iterations=2)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        x, y, cw, ch = cv2.boundingRect(max(contours, key=cv2.contourArea))
+        if cw * ch >= 0.2 * sw * sh:
+            region = (x, y, cw, ch)
+
+    # No clear page outline - fall back to the bounding box of the ink
+    if region is None:
+        ink = cv2.adaptiveThreshold(blurred, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                    cv2.THRESH_BINARY_INV, 25, 15)
+        points = cv2.findNonZero(ink)
+        if points is None:
+            return None
+        region = cv2.boundingRect(points)
+        margin = max(margin, 0.1)  # Leave room for faint strokes the threshold missed
+
+    x, y, cw, ch = region
+    pad_x, pad_y = int(cw * margin) + 1, int(ch * margin) + 1
+    x0 = max(0, int((x - pad_x) / scale))
+    y0 = max(0, int((y - pad_y) / scale))
+    x1 = min(w, int((x + cw + pad_x) / scale))
+    y1 = min(h, int((y + ch + pad_y) / scale))
+
+    if (x1 - x0) * (y1 - y0) > 0.9 * w * h:
+        return None
+    return x0, y0, x1, y1
+
+
+class DecodedImage:
+    """An uploaded image: the encoded bytes plus a lazily shared BGR/gray frame"""
+
+    def __init__(self, raw, mime_type=None, timings=None):
+        self.raw = raw
+        self.mime_type = mime_type or _sniff_mime_type(raw)
+        self.timings = timings if timings is not None else {}
+        self._frame = None
+        self._gray = None
+        self._decoded = False
+        self._work_frame = None
+        self._upload_part = None
+        self._digest = None
+        self._prepared = False
+        self.reused = False  # True when rebuilt from an earlier turn's retain()
+
+    @contextmanager
+    def timed(self, stage):
+        """Record how long `stage` took, in milliseconds, and report it as a span"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[stage] = self.timings.get(stage, 0) + elapsed * 1000
+            record_span(stage, elapsed)
+
+    @property
+    def frame(self):
+        """BGR frame, or None if the bytes are not a decodable image"""
+        if not self._decoded and not self.raw:
+            self._decoded = True
+        if not self._decoded:
+            with self.timed('imdecode'):
+                # np.frombuffer is a zero-copy view over the uploaded bytes
+                self._frame = cv2.imdecode(np.frombuffer(self.raw, np.uint8), cv2.IMREAD_COLOR)
+            self._decoded = True
+        return self._frame
+
+    @property
+    def work_frame(self):
+        """The frame analyzers should look at: cropped/downscaled once prepared"""
+        return self._work_frame if self._work_frame is not None else self.frame
+
+    @property
+    def gray(self):
+        if self._gray is None and self.work_frame is not None:
+            with self.timed('grayscale'):
+                self._gray = cv2.cvtColor(self.work_frame, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def digest(self):
+        """SHA-256 of the bytes sent to the analyzers, for cache keys"""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.gemini_part()['data']).hexdigest()
+        return self._digest
+
+    def prepare(self, max_edge=1600, crop=True, upload_format='jpeg', quality=85):
+        """
+        Crop the frame to the worksheet, downscale it to `max_edge` and
+        re-encode it for upload. Analyzers then work on the smaller frame.
+        """
+        if self._prepared:
+            return
+        frame = self.frame
+        if frame is None:
+            return
+        self._prepared = True
+
+        work = frame
+        if crop:
+            with self.timed('crop'):
+                full_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                region = find_document_region(full_gray)
+                if region:
+                    x0, y0, x1, y1 = region
+                    work = frame[y0:y1, x0:x1]  # a view, not a copy
+
+        h, w = work.shape[:2]
+        if max_edge and max(h, w) > max_edge:
+            with self.timed('resize'):
+                scale = max_edge / max(h, w)
+                work = cv2.resize(work, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+        if work is frame:
+            return  # Nothing changed - keep sending the original bytes
+        self._work_frame = work
+        self._gray = None
+        self._digest = None
+
+        with self.timed('encode'):
+            if upload_format == 'webp':
+                ok, encoded = cv2.imencode('.webp', work, [cv2.IMWRITE_WEBP_QUALITY, quality])
+                mime_type = 'image/webp'
+            else:
+                ok, encoded = cv2.imencode('.jpg', work, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                mime_type = 'image/jpeg'
+        if ok and encoded.nbytes < len(self.raw):
+            self._upload_part = {"mime_type": mime_type, "data": encoded.tobytes()}
+
+    def gemini_part(self):
+        """Inline image part for Gemini - the prepared upload, or the original bytes"""
+        if self._upload_part is not None:
+            return self._upload_part
+        return {"mime_type": self.mime_type, "data": self.raw}
+
+    def retain(self):
+        """
+        What to keep of this image between turns: the prepared upload bytes
+        (already cropped and downscaled) and their digest, not the decoded frame.
+        """
+        part = self.gemini_part()
+        return part['data'], part['mime_type'], self.digest
+
+    def timing_summary(self):
+        stages = ", ".join(f"{name} {ms:.1f}ms" for name, ms in self.timings.items())
+        if self.reused:
+            return f"{len(self.raw)} bytes, reused from an earlier turn: {stages}"
+        if self.frame is None:
+            return f"{len(self.raw)} bytes, undecodable: {stages}"
+        size = f"{self.frame.shape[1]}x{self.frame.shape[0]}"
+        if self._work_frame is not None:
+            size += f" -> {self._work_frame.shape[1]}x{self._work_frame.shape[0]}"
+        upload = len(self.gemini_part()['data'])
+        return f"{len(self.raw)} bytes, {size}, upload {upload} bytes: {stages}"
+
+
+def from_upload(raw, mime_type=None):
+    """Ingest raw image bytes from a multipart or octet-stream upload"""
+    if mime_type in (None, '', 'application/octet-stream'):
+        mime_type = None
+    return DecodedImage(raw, mime_type)
+
+
+def from_retained(retained):
+    """Rebuild a ready-to-analyze image from DecodedImage.retain()"""
+    raw, mime_type, digest = retained
+    image = DecodedImage(raw, mime_type)
+    image._prepared = True
+    image._digest = digest
+    image.reused = True
+    return image
+
+
+def decode_data_url(image_data):
+    """Ingest a `data:image/...;base64,...` string (or bare base64)"""
+    timings = {}
+    start = time.perf_counter()
+    header, sep, encoded = image_data.partition(',')
+    if not sep:
+        header, encoded = '', image_data
+    try:
+        raw = base64.b64decode(encoded)
+    except (binascii.Error, ValueError):
+        raw = b''  # Reported downstream as an undecodable image
+    elapsed = time.perf_counter() - start
+    timings['b64decode'] = elapsed * 1000
+    record_span('b64decode', elapsed)
+
+    mime_type = None
+    if header.startswith('data:'):
+        mime_type = header[5:].split(';')[0] or None
+    return DecodedImage(raw, mime_type, timings)
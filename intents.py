@@ -0,0 +1,74 @@
+"""
+Single-pass intent classifier for student messages.
+
+The keyword tables live in intents.json (or the file named by INTENT_RULES):
+each intent maps to the phrases that signal it, in any language. All phrases
+are compiled into one regex trie, so a message is scanned once no matter how
+many intents or phrases are configured. An intent matches when any of its
+phrases occurs anywhere in the lowercased message.
+"""
+import json
+import os
+import re
+
+DEFAULT_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intents.json')
+
+
+def load_rules(path=DEFAULT_RULES):
+    """Read {intent: [phrases]} from a JSON file"""
+    with open(path, encoding='utf-8') as f:
+        rules = json.load(f)
+    if not isinstance(rules, dict) or not all(isinstance(p, list) for p in rules.values()):
+        raise ValueError(f"{path}: expected an object mapping each intent to a list of phrases")
+    return rules
+
+
+class IntentClassifier:
+    """Finds every configured intent in a message with one regex scan"""
+
+    def __init__(self, rules):
+        self.intents = tuple(rules)
+
+        trie = {}
+        for intent, phrases in rules.items():
+            for phrase in phrases:
+                phrase = phrase.lower()
+                if not phrase:
+                    continue
+                node = trie
+                for char in phrase:
+                    node = node.setdefault(char, {})
+                node.setdefault(None, set()).add(intent)
+
+        # Each phrase end gets an empty marker group naming the intents it
+        # signals, including those of shorter phrases it starts with (the
+        # regex only reports the longest phrase at each position)
+        self._markers = {}
+        body = self._compile(trie, frozenset())
+        self._pattern = re.compile(f"(?=(?:{body}))", re.DOTALL) if body else None
+
+    def _compile(self, node, inherited):
+        intents = inherited | node.get(None, set())
+        branches = [re.escape(char) + self._compile(child, intents)
+                    for char, child in sorted(node.items(), key=lambda item: item[0] or '')
+                    if char is not None]
+        if node.get(None):
+            group = f"m{len(self._markers)}"
+            self._markers[group] = intents
+            branches.append(f"(?P<{group}>)")
+        if not branches:
+            return ''
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_RULES):
+        return cls(load_rules(path))
+
+    def classify(self, message):
+        """The set of intents found in `message`"""
+        if not message or self._pattern is None:
+            return frozenset()
+        found = set()
+        for match in self._pattern.finditer(message.lower()):
+            found |= self._markers[match.lastgroup]
+        return frozenset(found)
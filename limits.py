@@ -0,0 +1,162 @@
+"""
+Admission control for slow upstream calls (Gemini, Fish Audio).
+
+Each upstream service gets a fixed number of concurrent slots and a bounded
+wait queue. Requests beyond that are turned away right away with
+UpstreamOverloaded, so they don't tie up server threads. A circuit breaker
+stops calling a service that keeps failing until a probe call succeeds.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+class UpstreamOverloaded(Exception):
+    """Raised when an upstream limiter can't admit another call"""
+
+    def __init__(self, name, status_code, retry_after):
+        super().__init__(f"{name} is busy, please retry in {retry_after}s")
+        self.name = name
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class UpstreamLimiter:
+    """
+    At most `max_active` calls run at once and at most `max_queued` more may
+    wait up to `queue_timeout` seconds for a slot. A full queue is rejected
+    with 429, a wait that times out with 503.
+    """
+
+    def __init__(self, name, max_active, max_queued, queue_timeout=10.0):
+        self.name = name
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_active)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def acquire(self):
+        """Take a slot or raise UpstreamOverloaded; pair with release()"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queued:
+                    self.rejected += 1
+                    raise UpstreamOverloaded(self.name, 429, 2)
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.timed_out += 1
+                raise UpstreamOverloaded(self.name, 503, max(1, math.ceil(self.queue_timeout)))
+
+        with self._lock:
+            self.active += 1
+            self.admitted += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": self.active,
+                "waiting": self.waiting,
+                "max_active": self.max_active,
+                "max_queued": self.max_queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out
+            }
+
+
+class CircuitBreaker:
+    """
+    Closed: calls go through. After `failure_threshold` consecutive failures
+    the breaker opens and allow() returns False for `reset_timeout` seconds.
+    Then it is half-open: one probe call is let through, and its outcome
+    closes the breaker again or re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self.successes_total = 0
+        self.failures_total = 0
+        self.short_circuited = 0
+        self.times_opened = 0
+
+    def allow(self):
+        """True if a call may be attempted now; pair with record_success/failure"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                print(f"🔌 {self.name} circuit half-open, sending a probe")
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.successes_total += 1
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                print(f"🔌 {self.name} circuit closed")
+                self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures_total += 1
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (
+                    self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                print(f"🔌 {self.name} circuit open for {self.reset_timeout:g}s")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "successes": self.successes_total,
+                "failures": self.failures_total,
+                "short_circuited": self.short_circuited,
+                "times_opened": self.times_opened
+            }
@@ -0,0 +1,174 @@
+"""
+Prometheus-style metrics: counters, latency/size histograms and timing spans.
+
+Hot paths record spans with `span()` / `record_span()`. Every span feeds the
+`tutor_span_seconds` histogram; while a request is being profiled (see
+`start_profile`) its spans are also collected for a Server-Timing header,
+including those of work it hands to thread pools with `submit_profiled()`.
+Existing stats (caches, limiters, ...) are exported through collectors
+instead of being counted twice.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Histogram:
+    """Cumulative-bucket histogram for one label set"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class MetricsRegistry:
+    """Thread-safe store of metric families, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}  # name -> (kind, help, buckets)
+        self._samples = {}   # name -> {labels tuple: value or Histogram}
+        self._collectors = []
+
+    def describe(self, name, kind, help_text, buckets=None):
+        """Declare a 'counter', 'gauge' or 'histogram' family"""
+        with self._lock:
+            self._families[name] = (kind, help_text, buckets)
+            self._samples.setdefault(name, {})
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            samples = self._samples[name]
+            samples[key] = samples.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            samples = self._samples[name]
+            histogram = samples.get(key)
+            if histogram is None:
+                histogram = samples[key] = Histogram(self._families[name][2])
+            histogram.observe(value)
+
+    def add_collector(self, collect):
+        """
+        Register `collect()`, called at render time, yielding
+        (name, kind, help, labels, value) for counters and gauges kept elsewhere.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (kind, help_text, _) in self._families.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in self._samples[name].items():
+                    if kind != 'histogram':
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets, value.counts):
+                        cumulative += count
+                        le = _format_labels(labels + (('le', _format_value(float(bound))),))
+                        lines.append(f"{name}_bucket{le} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {value.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+
+        # Samples of one family must be contiguous, so group them by name first
+        collected = {}
+        for collect in self._collectors:
+            for name, kind, help_text, labels, value in collect():
+                family = collected.setdefault(name, [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+                family.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+        for family in collected.values():
+            lines.extend(family)
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+metrics.describe('tutor_span_seconds', 'histogram', "Time spent in each hot-path stage", LATENCY_BUCKETS)
+metrics.describe('tutor_request_seconds', 'histogram', "Request latency until the response headers", LATENCY_BUCKETS)
+metrics.describe('tutor_payload_bytes', 'histogram', "Size of uploads, Gemini prompts and image parts, and TTS audio", SIZE_BUCKETS)
+metrics.describe('tutor_gemini_tokens_total', 'counter', "Tokens reported by Gemini, by kind (prompt, cached, output)")
+metrics.describe('tutor_response_bytes_total', 'counter', "Bytes of compressed responses before and after compression")
+
+
+# Spans of the request being profiled in this context, or None
+_profile = ContextVar('profile', default=None)
+
+
+def record_span(name, seconds):
+    metrics.observe('tutor_span_seconds', seconds, span=name)
+    spans = _profile.get()
+    if spans is not None:
+        spans.append((name, seconds))
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block as span `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def submit_profiled(pool, fn, *args):
+    """
+    pool.submit() that runs `fn` in a copy of the caller's context, so the
+    spans it records count towards the request being profiled
+    """
+    return pool.submit(copy_context().run, fn, *args)
+
+
+def start_profile():
+    """Collect the spans recorded in this context until stop_profile()"""
+    _profile.set([])
+
+
+def stop_profile():
+    """Stop profiling and return the Server-Timing header value (or None)"""
+    spans = _profile.get()
+    _profile.set(None)
+    if spans is None:
+        return None
+    totals = {}
+    for name, seconds in spans:
+        totals[name] = totals.get(name, 0) + seconds
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totals.items())
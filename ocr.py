@@ -0,0 +1,115 @@
+"""
+Tesseract OCR fallback.
+
+Each preprocessing variant is OCR'd in its own tesseract subprocess, so the
+variants run concurrently in a small thread pool. The most confident result
+wins, and we stop waiting as soon as one variant is confident enough.
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import cv2
+import pytesseract
+
+from metrics import span, submit_profiled
+
+
+def _otsu(gray):
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+
+def _adaptive(gray):
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                 cv2.THRESH_BINARY, 11, 2)
+
+
+def _denoise(gray):
+    return _otsu(cv2.medianBlur(gray, 3))
+
+
+# Preprocessing variants, in the order they are submitted
+OCR_VARIANTS = {
+    'original': lambda gray: gray,
+    'threshold': _otsu,
+    'adaptive': _adaptive,
+    'denoise': _denoise,
+}
+
+DEFAULT_VARIANTS = [v.strip() for v in os.environ.get(
+    'OCR_VARIANTS', 'original,threshold,adaptive').split(',') if v.strip()]
+MIN_CONFIDENCE = float(os.environ.get('OCR_MIN_CONFIDENCE', '80'))
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', str(min(4, os.cpu_count() or 1))))
+TESSERACT_CONFIG = '--psm 6'
+
+# Threads are enough: the real work happens in the tesseract subprocesses
+ocr_pool = ThreadPoolExecutor(max_workers=OCR_WORKERS, thread_name_prefix='ocr')
+
+
+class OcrResult:
+    __slots__ = ('variant', 'text', 'confidence')
+
+    def __init__(self, variant, text, confidence):
+        self.variant = variant
+        self.text = text
+        self.confidence = confidence
+
+
+def ocr_variant(name, gray):
+    """OCR one preprocessing variant; confidence is the mean word confidence"""
+    with span(f"ocr_{name}"):
+        processed = OCR_VARIANTS[name](gray)
+        data = pytesseract.image_to_data(processed, config=TESSERACT_CONFIG,
+                                         output_type=pytesseract.Output.DICT)
+
+    lines = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        conf = float(data['conf'][i])
+        if not word.strip() or conf < 0:
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(key, []).append(word)
+        confidences.append(conf)
+
+    text = "\n".join(" ".join(words) for words in lines.values())
+    confidence = sum(confidences) / len(confidences) if confidences else 0.0
+    return OcrResult(name, text, confidence)
+
+
+def preprocess_image_for_ocr(gray, variants=None, min_confidence=None):
+    """
+    OCR a grayscale image with several preprocessing variants in parallel and
+    return the text of the most confident one. Returns "" if nothing was
+    read, and None if every variant failed (e.g. tesseract is missing).
+
+    Stopping early only cancels variants that haven't started; tesseract runs
+    already in progress finish in the background and keep their ocr_pool
+    workers busy until then.
+    """
+    variants = variants or DEFAULT_VARIANTS
+    min_confidence = MIN_CONFIDENCE if min_confidence is None else min_confidence
+
+    pending = {submit_profiled(ocr_pool, ocr_variant, name, gray) for name in variants}
+    best = None
+    failed = 0
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"OCR variant error: {e}")
+                failed += 1
+                continue
+            if result.text and (best is None or result.confidence > best.confidence):
+                best = result
+
+        if best and best.confidence >= min_confidence:
+            # Good enough - don't wait for the slower variants
+            for future in pending:
+                future.cancel()
+            break
+
+    if best:
+        return best.text
+    return None if failed == len(variants) else ""
@@ -0,0 +1,106 @@
+"""
+Quality gate for captured photos, run before Gemini or OCR.
+
+Clearly unusable photos - too dark, washed out, blank or badly blurred - are
+turned away in a few milliseconds with feedback on what to fix, instead of
+spending a Gemini call or three Tesseract passes on them. The checks run on
+a small grayscale copy of the decoded frame; only photos that are clearly
+bad are rejected, borderline ones still go to the analyzers.
+"""
+import os
+
+import cv2
+import numpy as np
+
+CHECK_EDGE = 640  # Longest edge of the copy the checks run on
+
+# Mean brightness (0-255) below which the photo is too dark
+MIN_BRIGHTNESS = float(os.environ.get('QUALITY_MIN_BRIGHTNESS', '40'))
+# Overexposed: mean brightness above MAX_BRIGHTNESS and even the darkest 1% of
+# pixels brighter than MAX_BLACK_LEVEL, so the writing is washed out
+MAX_BRIGHTNESS = float(os.environ.get('QUALITY_MAX_BRIGHTNESS', '235'))
+MAX_BLACK_LEVEL = float(os.environ.get('QUALITY_MAX_BLACK_LEVEL', '200'))
+# Blank: fewer pixels than this share look like ink or pencil strokes...
+MIN_INK = float(os.environ.get('QUALITY_MIN_INK', '0.002'))
+# ...and fewer than this share are edges. A single line of writing on a
+# 12MP photo can have under 0.1% ink but still has clear edges.
+MIN_EDGES = float(os.environ.get('QUALITY_MIN_EDGES', '0.0001'))
+# Variance of the Laplacian along edges; sharp writing scores in the thousands
+MIN_SHARPNESS = float(os.environ.get('QUALITY_MIN_SHARPNESS', '50'))
+
+# Checked in this order: a dark or blank photo also has no sharp edges
+REASONS = ('too_dark', 'washed_out', 'blank', 'blurry')
+
+FEEDBACK = {
+    'too_dark': "🌙 This photo is too dark for me to read.\n\n"
+                "💡 **Please try again:**\n"
+                "• Turn on a light or move closer to a window\n"
+                "• Make sure your hand or phone isn't shading the paper",
+    'washed_out': "☀️ This photo is too bright - the writing is washed out.\n\n"
+                  "💡 **Please try again:**\n"
+                  "• Move out of direct sunlight\n"
+                  "• Tilt the paper so the light doesn't reflect off it",
+    'blank': "📄 I can't see any writing in this photo.\n\n"
+             "💡 **Please try again:**\n"
+             "• Point the camera at your work\n"
+             "• Write darker if you're using a light pencil",
+    'blurry': "🔍 This photo is too blurry to read.\n\n"
+              "💡 **Please try again:**\n"
+              "• Hold the phone still while the photo is taken\n"
+              "• Tap on the screen to focus on your writing\n"
+              "• Move the camera a little further from the paper",
+}
+
+
+def measure(frame):
+    """Brightness, black level, ink share, edge share and sharpness of a BGR frame"""
+    h, w = frame.shape[:2]
+    scale = min(1.0, CHECK_EDGE / max(h, w))
+    if scale < 1:
+        # Bilinear is ~20x cheaper than INTER_AREA here and good enough to judge quality
+        frame = cv2.resize(frame, (max(1, round(w * scale)), max(1, round(h * scale))),
+                           interpolation=cv2.INTER_LINEAR)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    pixels = gray.size
+
+    # Exposure, from the histogram
+    hist = np.bincount(gray.ravel(), minlength=256)
+    brightness = float(hist @ np.arange(256)) / pixels
+    black_level = int(np.searchsorted(np.cumsum(hist), 0.01 * pixels))
+
+    # Strokes darker than their surroundings
+    ink = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    ink_share = cv2.countNonZero(ink) / pixels
+
+    # Laplacian variance measured only along edges, so a sharp photo of a
+    # mostly empty page doesn't look blurry
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+    canny = cv2.Canny(gray, 50, 150)
+    edge_share = cv2.countNonZero(canny) / pixels
+    edges = cv2.dilate(canny, None)
+    if edge_share:
+        sharpness = float(cv2.meanStdDev(laplacian, mask=edges)[1][0, 0]) ** 2
+    else:
+        sharpness = 0.0
+
+    return {
+        "brightness": round(brightness, 1),
+        "black_level": black_level,
+        "ink": round(ink_share, 4),
+        "edges": round(edge_share, 5),
+        "sharpness": round(sharpness, 1)
+    }
+
+
+def check(frame):
+    """(reason, measurements): reason is one of REASONS, or None if the photo is usable"""
+    m = measure(frame)
+    if m['brightness'] < MIN_BRIGHTNESS:
+        return 'too_dark', m
+    if m['brightness'] > MAX_BRIGHTNESS and m['black_level'] > MAX_BLACK_LEVEL:
+        return 'washed_out', m
+    if m['ink'] < MIN_INK and m['edges'] < MIN_EDGES:
+        return 'blank', m
+    if m['sharpness'] < MIN_SHARPNESS:
+        return 'blurry', m
+    return None, m
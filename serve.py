@@ -0,0 +1,39 @@
+"""
+Production launcher: serves the Flask app with cheroot, a multi-threaded
+WSGI server with TLS support that runs on macOS, Linux and Windows.
+"""
+from cheroot import wsgi
+from cheroot.ssl.builtin import BuiltinSSLAdapter
+
+
+def make_server(app, host='0.0.0.0', port=5001, threads=32, queue_size=32, ssl=None, queue_timeout=1.0):
+    """
+    Build a server for `app` with a fixed pool of `threads` request threads.
+    At most `queue_size` accepted connections wait for a thread; once that
+    queue has been full for `queue_timeout` seconds, new ones get a 503.
+    `ssl` is an optional (cert_path, key_path) pair.
+    """
+    server = wsgi.Server(
+        (host, port),
+        app,
+        numthreads=threads,
+        max=threads,
+        request_queue_size=queue_size,  # listen() backlog
+        accepted_queue_size=queue_size,
+        accepted_queue_timeout=queue_timeout,  # Blocks the accept loop meanwhile, so keep it short
+        timeout=60
+    )
+    if ssl:
+        server.ssl_adapter = BuiltinSSLAdapter(*ssl)
+    return server
+
+
+def serve(app, host='0.0.0.0', port=5001, threads=32, queue_size=32, ssl=None):
+    """Run `app` on a make_server() server until interrupted"""
+    server = make_server(app, host, port, threads, queue_size, ssl)
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        print("👋 Shutting down...")
+    finally:
+        server.stop()
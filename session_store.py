@@ -0,0 +1,523 @@
+"""
+Pluggable storage backends for chat sessions.
+
+Every backend records individual session/message events instead of rewriting
+the whole history, so the cost of a write does not depend on how many
+sessions have been stored so far.
+"""
+import bisect
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import span
+
+
+def _atomic_write_json(path, data):
+    """Write JSON to a temp file, fsync it and rename it over the target"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    # Make the rename itself durable (best effort, not supported everywhere)
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+
+def _read_json_sessions(path):
+    """Read a legacy chat_sessions.json file (a list of session dicts)"""
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class SessionStore:
+    """Interface shared by all session storage backends"""
+
+    def load(self):
+        """Return all stored sessions, newest first"""
+        raise NotImplementedError
+
+    def add_session(self, session):
+        raise NotImplementedError
+
+    def add_message(self, session_id, message, index):
+        """Record `message` as the `index`-th message of a session"""
+        raise NotImplementedError
+
+    def delete_session(self, session_id):
+        raise NotImplementedError
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, snapshot):
+        """
+        Fold the recorded events into a fresh snapshot, possibly in the
+        background. `snapshot` is called with the store locked and returns
+        the current list of sessions, so no event can slip in between taking
+        the snapshot and resetting the log.
+        """
+        pass
+
+    def close(self):
+        pass
+
+
+class AppendLogStore(SessionStore):
+    """
+    Append-only event log on top of a JSON snapshot.
+
+    The snapshot uses the same format as the original chat_sessions.json, so
+    an existing file is imported as-is. Events are appended one JSON line at a
+    time and folded into a new snapshot every `compact_every` events.
+
+    Compaction runs in a background thread. It takes the snapshot and moves
+    the log aside to `<log>.1` under the store lock, then writes the snapshot
+    file without holding it, so writers only wait for the in-memory copy.
+    Until the new snapshot is in place, loading replays both logs. Replaying
+    an event twice is harmless, which keeps a crash at any point safe.
+    """
+
+    def __init__(self, snapshot_path, log_path=None, compact_every=500, fsync=False):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path or f"{os.path.splitext(snapshot_path)[0]}.log"
+        self.rotated_path = f"{self.log_path}.1"
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._log = None
+        self._pending_events = 0
+        self._compaction = None
+
+    def load(self):
+        with self._lock:
+            sessions = _read_json_sessions(self.snapshot_path)
+            by_id = {s['id']: s for s in sessions}
+            self._pending_events = 0
+
+            # A log moved aside by an unfinished compaction comes first
+            for path in (self.rotated_path, self.log_path):
+                if os.path.exists(path):
+                    sessions = self._replay(path, sessions, by_id)
+
+            self._log = open(self.log_path, 'a')
+            return sessions
+
+    def _replay(self, path, sessions, by_id):
+        good_offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash - drop it and everything after
+                    print(f"⚠️  Ignoring damaged tail of {path}")
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                sessions = self._apply(sessions, by_id, event)
+                good_offset += len(line)
+                self._pending_events += 1
+
+        if good_offset != os.path.getsize(path):
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+        return sessions
+
+    @staticmethod
+    def _apply(sessions, by_id, event):
+        op = event.get('op')
+        if op == 'session':
+            session = event['session']
+            if session['id'] not in by_id:
+                sessions.insert(0, session)
+                by_id[session['id']] = session
+        elif op == 'message':
+            session = by_id.get(event['session_id'])
+            if session is not None and len(session['messages']) == event['index']:
+                session['messages'].append(event['message'])
+        elif op == 'delete':
+            if by_id.pop(event['session_id'], None) is not None:
+                sessions = [s for s in sessions if s['id'] != event['session_id']]
+        return sessions
+
+    def _append(self, event):
+        line = json.dumps(event, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._log.write(line)
+            self._log.flush()
+            if self.fsync:
+                os.fsync(self._log.fileno())
+            self._pending_events += 1
+
+    def add_session(self, session):
+        self._append({"op": "session", "session": session})
+
+    def add_message(self, session_id, message, index):
+        self._append({"op": "message", "session_id": session_id, "index": index, "message": message})
+
+    def delete_session(self, session_id):
+        self._append({"op": "delete", "session_id": session_id})
+
+    def needs_compaction(self):
+        return self._pending_events >= self.compact_every and not self._compacting()
+
+    def _compacting(self):
+        return self._compaction is not None and self._compaction.is_alive()
+
+    def compact(self, snapshot):
+        with self._lock:
+            if self._compacting():
+                return
+            self._compaction = threading.Thread(target=self._compact, args=(snapshot,),
+                                                name='session-compaction', daemon=True)
+            self._compaction.start()
+
+    def _compact(self, snapshot):
+        try:
+            with span('save_sessions'):
+                with self._lock:
+                    sessions = snapshot()
+                    self._rotate_log()
+                    self._pending_events = 0
+                # New events go to the fresh log while the snapshot is written
+                _atomic_write_json(self.snapshot_path, sessions)
+                os.remove(self.rotated_path)
+        except Exception as e:
+            # The rotated log is kept and folded in by the next compaction
+            print(f"⚠️  Session log compaction failed: {e}")
+
+    def _rotate_log(self):
+        self._log.close()
+        if os.path.exists(self.rotated_path):
+            # Left by a compaction that failed: keep its events as well
+            with open(self.log_path, 'rb') as src, open(self.rotated_path, 'ab') as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            os.replace(self.log_path, self.rotated_path)
+        self._log = open(self.log_path, 'w')
+
+    def close(self):
+        if self._compaction is not None:
+            self._compaction.join()
+        with self._lock:
+            if self._log:
+                self._log.close()
+                self._log = None
+
+
+class SqliteStore(SessionStore):
+    """
+    SQLite backend with one row per session and one row per message.
+
+    On first use the database is seeded from the legacy JSON file.
+    """
+
+    def __init__(self, db_path, import_path=None, compact_every=500):
+        self.db_path = db_path
+        self.import_path = import_path
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pending_writes = 0
+
+    def load(self):
+        with self._lock:
+            is_new = not os.path.exists(self.db_path)
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            with self._conn:
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                        id TEXT UNIQUE NOT NULL,
+                        data TEXT NOT NULL
+                    )""")
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS messages (
+                        session_id TEXT NOT NULL,
+                        idx INTEGER NOT NULL,
+                        data TEXT NOT NULL,
+                        PRIMARY KEY (session_id, idx)
+                    )""")
+
+            if is_new and self.import_path:
+                self._import(_read_json_sessions(self.import_path))
+
+            sessions = []
+            by_id = {}
+            for session_id, data in self._conn.execute(
+                    "SELECT id, data FROM sessions ORDER BY seq DESC"):
+                session = json.loads(data)
+                session['messages'] = []
+                sessions.append(session)
+                by_id[session_id] = session
+            for session_id, data in self._conn.execute(
+                    "SELECT session_id, data FROM messages ORDER BY session_id, idx"):
+                if session_id in by_id:
+                    by_id[session_id]['messages'].append(json.loads(data))
+            return sessions
+
+    def _import(self, sessions):
+        # Oldest first so that seq order matches the original list order
+        with self._conn:
+            for session in reversed(sessions):
+                self._insert_session(session)
+                for index, message in enumerate(session.get('messages', [])):
+                    self._insert_message(session['id'], message, index)
+        if sessions:
+            print(f"📥 Imported {len(sessions)} sessions from {self.import_path}")
+
+    def _insert_session(self, session):
+        header = {k: v for k, v in session.items() if k != 'messages'}
+        self._conn.execute(
+            "INSERT OR IGNORE INTO sessions (id, data) VALUES (?, ?)",
+            (session['id'], json.dumps(header)))
+
+    def _insert_message(self, session_id, message, index):
+        self._conn.execute(
+            "INSERT OR IGNORE INTO messages (session_id, idx, data) VALUES (?, ?, ?)",
+            (session_id, index, json.dumps(message)))
+
+    def add_session(self, session):
+        with self._lock, self._conn:
+            self._insert_session(session)
+            self._pending_writes += 1
+
+    def add_message(self, session_id, message, index):
+        with self._lock, self._conn:
+            self._insert_message(session_id, message, index)
+            self._pending_writes += 1
+
+    def delete_session(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._pending_writes += 1
+
+    def needs_compaction(self):
+        return self._pending_writes >= self.compact_every
+
+    def compact(self, snapshot):
+        # The rows already are the state - just fold the WAL back into the db
+        with span('save_sessions'), self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._pending_writes = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+
+class SessionIndex:
+    """
+    In-memory sessions keyed by id, iterated newest first.
+
+    Lookup, insert and delete are O(1). The number of assistant replies per
+    session is kept alongside (not in the session dicts, which get persisted
+    and returned to clients) so callers don't need to rescan its messages,
+    and every change bumps a version number so clients can sync only what
+    changed.
+
+    The index itself is guarded by a short-lived lock; turns within one
+    session are serialized with that session's own lock (`session_lock`), so
+    different sessions never wait on each other.
+    """
+
+    def __init__(self, sessions=(), max_tombstones=1000):
+        self._lock = threading.Lock()
+        self._by_id = OrderedDict()
+        self._session_locks = {}
+        self._versions = {}
+        self._assistant_counts = {}
+        # Page cursors are positions: newer sessions have higher ones, and
+        # _positions lists them in ascending order (newest last)
+        self._position_of = {}
+        self._at_position = {}
+        self._positions = []
+        self._next_position = 0
+        self._tombstones = OrderedDict()
+        self.max_tombstones = max_tombstones
+        self.boot_id = f"{int(time.time() * 1000):x}"
+        self.version = 0
+        self._oldest_tombstone = 0
+        for session in sessions:
+            session.pop('assistant_count', None)  # Persisted by earlier versions
+            self._assistant_counts[session['id']] = sum(
+                1 for m in session.get('messages', []) if m.get('role') == 'assistant')
+            self._by_id[session['id']] = session
+            self._versions[session['id']] = 0
+        # Loaded newest first
+        for session in reversed(self._by_id.values()):
+            self._place(session['id'])
+
+    def _place(self, session_id):
+        """Give a session the next (newest) position"""
+        self._unplace(session_id)
+        position = self._next_position
+        self._next_position += 1
+        self._position_of[session_id] = position
+        self._at_position[position] = session_id
+        self._positions.append(position)
+
+    def _unplace(self, session_id):
+        position = self._position_of.pop(session_id, None)
+        if position is not None:
+            del self._at_position[position]
+            del self._positions[bisect.bisect_left(self._positions, position)]
+
+    def _touch(self, session_id):
+        self.version += 1
+        self._versions[session_id] = self.version
+
+    def get(self, session_id):
+        with self._lock:
+            return self._by_id.get(session_id)
+
+    def session_lock(self, session_id):
+        """Lock serializing turns (message + reply) within one session"""
+        with self._lock:
+            lock = self._session_locks.get(session_id)
+            if lock is None:
+                lock = self._session_locks[session_id] = threading.Lock()
+            return lock
+
+    def add(self, session):
+        """Insert a session at the front (most recent) of the index"""
+        with self._lock:
+            self._assistant_counts.setdefault(session['id'], sum(
+                1 for m in session.get('messages', []) if m.get('role') == 'assistant'))
+            self._by_id[session['id']] = session
+            self._by_id.move_to_end(session['id'], last=False)
+            self._place(session['id'])
+            self._tombstones.pop(session['id'], None)
+            self._touch(session['id'])
+
+    def remove(self, session_id):
+        with self._lock:
+            session = self._by_id.pop(session_id, None)
+            self._session_locks.pop(session_id, None)
+            self._assistant_counts.pop(session_id, None)
+            self._unplace(session_id)
+            if session is not None:
+                self._versions.pop(session_id, None)
+                self.version += 1
+                self._tombstones[session_id] = self.version
+                if len(self._tombstones) > self.max_tombstones:
+                    _, self._oldest_tombstone = self._tombstones.popitem(last=False)
+            return session
+
+    def append_message(self, session, message):
+        """Append a message to a session and return its position"""
+        with self._lock:
+            session['messages'].append(message)
+            if message.get('role') == 'assistant':
+                self._assistant_counts[session['id']] = self._assistant_counts.get(session['id'], 0) + 1
+            if session['id'] in self._by_id:
+                self._touch(session['id'])
+            return len(session['messages']) - 1
+
+    def assistant_count(self, session_id):
+        """Number of assistant replies in a session (0 if unknown)"""
+        with self._lock:
+            return self._assistant_counts.get(session_id, 0)
+
+    def snapshot(self):
+        """Point-in-time copy of all sessions, safe to serialize off-lock"""
+        with self._lock:
+            return [{**s, 'messages': list(s['messages'])} for s in self._by_id.values()]
+
+    @property
+    def sync_token(self):
+        """Opaque token identifying the current state, usable as an ETag"""
+        with self._lock:
+            return f"{self.boot_id}-{self.version}"
+
+    def page(self, cursor=None, limit=20):
+        """
+        Return (sessions, next_cursor): up to `limit` sessions older than
+        `cursor`, newest first. The cursor is a position, so it stays valid
+        when sessions around it are deleted. Returns None if the cursor is
+        from a previous run or malformed.
+        """
+        end = None
+        if cursor:
+            boot_id, _, position = cursor.partition('-')
+            if boot_id != self.boot_id or not position.isdigit():
+                return None
+            end = int(position)
+        with self._lock:
+            stop = len(self._positions) if end is None else bisect.bisect_left(self._positions, end)
+            positions = self._positions[max(0, stop - limit):stop][::-1]
+            page = [self._by_id[self._at_position[p]] for p in positions]
+            next_cursor = f"{self.boot_id}-{positions[-1]}" if stop > limit else None
+            return page, next_cursor
+
+    def changes_since(self, token):
+        """
+        Return (changed_sessions, deleted_ids) since `token`, or None if the
+        token is from a previous run or too old to compute a delta from.
+        """
+        boot_id, _, version = (token or '').partition('-')
+        if boot_id != self.boot_id or not version.isdigit():
+            return None
+        version = int(version)
+        with self._lock:
+            if version < self._oldest_tombstone:
+                return None
+            changed = [s for s in self._by_id.values() if self._versions[s['id']] > version]
+            deleted = [sid for sid, v in self._tombstones.items() if v > version]
+            return changed, deleted
+
+    def list(self):
+        with self._lock:
+            return list(self._by_id.values())
+
+    def __iter__(self):
+        return iter(self.list())
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, session_id):
+        return session_id in self._by_id
+
+
+def summarize_session(session, preview_length=80):
+    """Sidebar-sized view of a session: no message bodies beyond a preview"""
+    messages = session.get('messages', [])
+    preview = messages[0]['content'][:preview_length] if messages else ''
+    return {
+        "id": session['id'],
+        "timestamp": session['timestamp'],
+        "preview": preview,
+        "message_count": len(messages)
+    }
+
+
+def create_session_store(backend, sessions_file, compact_every=500):
+    """Build the session store selected by `backend` ('log' or 'sqlite')"""
+    base = os.path.splitext(sessions_file)[0]
+    if backend == 'sqlite':
+        return SqliteStore(f"{base}.db", import_path=sessions_file, compact_every=compact_every)
+    if backend == 'log':
+        return AppendLogStore(sessions_file, f"{base}.log", compact_every=compact_every)
+    raise ValueError(f"Unknown session store backend: {backend}")
@@ -0,0 +1,285 @@
+"""
+Fish Audio text-to-speech client.
+
+Requests go through one pooled keep-alive HTTP session, and synthesized clips
+are cached in memory and on disk, keyed by text, voice and audio settings.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from caching import LRUCache
+from metrics import metrics, span
+
+FISH_AUDIO_URL = os.environ.get('FISH_AUDIO_URL', 'https://api.fish.audio/v1/tts')
+DEFAULT_VOICE = "8ef4a238714b45718ce04243307c57a7"
+# Sentences each stream may have queued or in synthesis at once
+TTS_STREAM_LOOKAHEAD = int(os.environ.get('TTS_STREAM_LOOKAHEAD', '2'))
+
+
+_SENTENCE_END = re.compile(r'(?<=[.!?:])\s+|\n+')
+
+
+def split_sentences(text, min_chars=40, max_chars=300):
+    """
+    Split text into sentence-sized chunks for synthesis. Very short sentences
+    are merged with the next one so that we don't pay a request per "Great!".
+    """
+    chunks = []
+    current = ''
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        current = f"{current} {sentence}" if current else sentence
+        if len(current) >= min_chars:
+            # Hard-wrap run-on sentences at a word boundary
+            while len(current) > max_chars:
+                cut = current.rfind(' ', 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                chunks.append(current[:cut])
+                current = current[cut:].strip()
+            chunks.append(current)
+            current = ''
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def strip_id3(audio):
+    """Drop a leading ID3v2 tag so MP3 clips can be concatenated into one stream"""
+    if len(audio) >= 10 and audio[:3] == b'ID3':
+        size = (audio[6] << 21) | (audio[7] << 14) | (audio[8] << 7) | audio[9]
+        return audio[10 + size:]
+    return audio
+
+
+class FishAudioError(Exception):
+    """Fish Audio answered with an error status or an empty clip"""
+
+    def __init__(self, message, status_code=500, details=''):
+        super().__init__(message)
+        self.status_code = status_code
+        self.details = details
+
+
+class AudioCache:
+    """
+    Two-level audio cache: a small in-memory LRU in front of a directory of
+    clips. The directory is kept under `disk_max_bytes` by deleting the least
+    recently used files.
+    """
+
+    def __init__(self, directory, disk_max_bytes=256 * 1024 * 1024, memory_max_bytes=32 * 1024 * 1024):
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.memory = LRUCache('tts_audio', max_entries=1024, ttl=24 * 3600, max_bytes=memory_max_bytes)
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+        self.disk_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith('.audio'):
+                self.disk_bytes += os.path.getsize(os.path.join(directory, name))
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def get(self, key):
+        audio = self.memory.get(key)
+        if audio is not None:
+            return audio
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+            os.utime(path)  # Mark as recently used for eviction
+        except OSError:
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        self.memory.set(key, audio)
+        return audio
+
+    def set(self, key, audio):
+        self.memory.set(key, audio)
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with self._lock:
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            with open(tmp_path, 'wb') as f:
+                f.write(audio)
+            os.replace(tmp_path, path)
+            self.disk_bytes += len(audio) - replaced
+            if self.disk_bytes > self.disk_max_bytes:
+                self._evict()
+
+    def _evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.audio'):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        # Trim to 90% of the budget so we don't evict on every write
+        while files and self.disk_bytes > self.disk_max_bytes * 0.9:
+            _, size, path = files.pop(0)
+            try:
+                os.remove(path)
+                self.disk_bytes -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        stats = self.memory.stats()
+        with self._lock:
+            stats.update({"disk_hits": self.disk_hits, "disk_bytes": self.disk_bytes})
+        return stats
+
+
+class FishAudioClient:
+    """Synthesizes speech with Fish Audio over a pooled keep-alive session"""
+
+    def __init__(self, api_key, cache=None, url=FISH_AUDIO_URL, pool_size=10, timeout=30):
+        self.api_key = api_key
+        self.cache = cache
+        self.url = url
+        self.timeout = timeout
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        self.http.headers.update({
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "model": "fishaudio-tts-1"  # Add the model header (check Fish Audio docs for correct model name)
+        })
+
+    def build_payload(self, text, reference_id=DEFAULT_VOICE, audio_format="mp3"):
+        return {
+            "text": text,
+            "reference_id": reference_id,
+            "format": audio_format,
+            "mp3_bitrate": 128,
+            "normalize": True,
+            "latency": "normal",
+            "chunk_length": 200
+        }
+
+    @staticmethod
+    def cache_key(payload):
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def synthesize(self, text, reference_id=DEFAULT_VOICE, audio_format="mp3"):
+        """
+        Return the audio bytes for `text`. Raises FishAudioError for API
+        errors and requests exceptions for timeouts/connection problems.
+        """
+        payload = self.build_payload(text, reference_id, audio_format)
+        key = self.cache_key(payload)
+        if self.cache:
+            audio = self.cache.get(key)
+            if audio is not None:
+                print(f"♻️  TTS cache hit: {len(audio)} bytes")
+                return audio
+
+        print(f"📢 TTS Request: {text[:50]}..." if len(text) > 50 else f"📢 TTS Request: {text}")
+        with span('tts_synthesis'):
+            response = self.http.post(self.url, json=payload, timeout=self.timeout)
+
+        if response.status_code != 200:
+            error_msg = f"Fish Audio API error: {response.status_code}"
+            try:
+                error_detail = response.json()
+                print(f"❌ {error_msg} - Details: {json.dumps(error_detail, indent=2)}")
+            except ValueError:
+                print(f"❌ {error_msg} - Response: {response.text}")
+            raise FishAudioError(error_msg, response.status_code, response.text[:500])
+
+        if len(response.content) == 0:
+            print("⚠️ Empty audio response from Fish Audio")
+            raise FishAudioError("Empty audio response")
+
+        print(f"✅ TTS Success: {len(response.content)} bytes")
+        metrics.observe('tutor_payload_bytes', len(response.content), kind='tts_audio')
+        if self.cache:
+            self.cache.set(key, response.content)
+        return response.content
+
+    def synthesize_stream(self, text, pool, reference_id=DEFAULT_VOICE, lookahead=None):
+        """
+        Synthesize `text` sentence by sentence on `pool` and yield the MP3
+        chunks in order as they become ready. Errors for the first chunk are
+        raised before anything is yielded. A later chunk that fails is retried
+        once; if it fails again the stream ends there, rather than playing on
+        with a sentence missing.
+
+        At most `lookahead` chunks per stream are queued or running at once,
+        so one long answer can't hold up other streams' first sentences in
+        the shared pool.
+        """
+        lookahead = lookahead or TTS_STREAM_LOOKAHEAD
+        chunks = split_sentences(text)
+        futures = deque()
+        submitted = 0
+        try:
+            for i in range(len(chunks)):
+                while submitted < len(chunks) and len(futures) < lookahead:
+                    futures.append(pool.submit(self.synthesize, chunks[submitted], reference_id))
+                    submitted += 1
+                try:
+                    audio = futures.popleft().result()
+                except Exception as e:
+                    if i == 0:
+                        raise
+                    print(f"⚠️ TTS chunk {i + 1}/{len(chunks)} failed, retrying: {e}")
+                    try:
+                        audio = self.synthesize(chunks[i], reference_id)
+                    except Exception as e:
+                        print(f"⚠️ Ending TTS stream at chunk {i + 1}/{len(chunks)}: {e}")
+                        return
+                yield audio if i == 0 else strip_id3(audio)
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def cached_clip(self, text, reference_id=DEFAULT_VOICE):
+        """The clip synthesize_clip() would return, if every sentence is cached; else None"""
+        if not self.cache:
+            return None
+        parts = []
+        for i, chunk in enumerate(split_sentences(text)):
+            audio = self.cache.get(self.cache_key(self.build_payload(chunk, reference_id)))
+            if audio is None:
+                return None
+            parts.append(audio if i == 0 else strip_id3(audio))
+        return b"".join(parts) or None
+
+    def synthesize_clip(self, text, pool, reference_id=DEFAULT_VOICE):
+        """
+        The whole clip for `text`, synthesized sentence by sentence like
+        synthesize_stream(), so the two share their cache entries
+        """
+        parts = list(self.synthesize_stream(text, pool, reference_id))
+        if not parts:
+            raise FishAudioError("Empty audio response")
+        if len(parts) < len(split_sentences(text)):
+            raise FishAudioError("Speech synthesis failed partway through", 502)
+        return b"".join(parts)
+
+
+# Worker threads for sentence-level synthesis; kept below the HTTP pool size
+tts_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('TTS_STREAM_WORKERS', '4')),
+                              thread_name_prefix='tts')
@@ -0,0 +1,229 @@
+"""
+Per-session tutoring state: when the current problem was started, how many
+hints were given and the problem text.
+
+The answer-reveal logic depends on this state, so it is bounded (TTL + LRU)
+and can be kept in SQLite next to the session store. The SQLite backend
+survives restarts and is shared by every worker process on the host.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ProblemState:
+    """Tracking record for the problem a session is working on"""
+
+    __slots__ = ('start_time', 'hint_count', 'problem_text', 'touched')
+
+    def __init__(self, start_time, hint_count=0, problem_text=None, touched=None):
+        self.start_time = start_time
+        self.hint_count = hint_count
+        self.problem_text = problem_text
+        self.touched = start_time if touched is None else touched
+
+
+class MemoryTutoringState:
+    """
+    In-process state for a single worker. Records expire `ttl` seconds after
+    their last use and the least recently used ones are evicted beyond
+    `max_entries`.
+    """
+
+    def __init__(self, max_entries=10000, ttl=24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _get(self, session_id, now):
+        record = self._records.get(session_id)
+        if record is None:
+            return None
+        if now - record.touched > self.ttl:
+            del self._records[session_id]
+            self.expirations += 1
+            return None
+        record.touched = now
+        self._records.move_to_end(session_id)
+        return record
+
+    def _put(self, session_id, record):
+        self._records[session_id] = record
+        self._records.move_to_end(session_id)
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+            self.evictions += 1
+
+    def elapsed(self, session_id):
+        """Seconds spent on the current problem; starts the timer if needed"""
+        now = time.time()
+        with self._lock:
+            record = self._get(session_id, now)
+            if record is None:
+                self._put(session_id, ProblemState(now))
+                return 0
+            return now - record.start_time
+
+    def hint_count(self, session_id):
+        with self._lock:
+            record = self._get(session_id, time.time())
+            return record.hint_count if record else 0
+
+    def reset(self, session_id, problem_text=None):
+        with self._lock:
+            self._put(session_id, ProblemState(time.time(), problem_text=problem_text))
+
+    def increment_hints(self, session_id):
+        """Count a hint and return the new total (0 if nothing is tracked)"""
+        with self._lock:
+            record = self._get(session_id, time.time())
+            if record is None:
+                return 0
+            record.hint_count += 1
+            return record.hint_count
+
+    def remove(self, session_id):
+        with self._lock:
+            self._records.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._records),
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+    def close(self):
+        pass
+
+
+class SqliteTutoringState:
+    """
+    SQLite-backed state shared by all processes using the same file. Every
+    operation is a single statement, so concurrent workers can't lose hint
+    increments. Expired and excess rows are pruned every `prune_every` writes.
+    """
+
+    def __init__(self, db_path, max_entries=10000, ttl=24 * 3600, prune_every=100):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prune_every = prune_every
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS problem_state (
+                    session_id TEXT PRIMARY KEY,
+                    start_time REAL NOT NULL,
+                    hint_count INTEGER NOT NULL DEFAULT 0,
+                    problem_text TEXT,
+                    touched REAL NOT NULL
+                )""")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS problem_state_touched ON problem_state (touched)")
+
+    def _write(self, sql, params):
+        """Run one write statement and prune periodically; caller holds the lock"""
+        with self._conn:
+            cursor = self._conn.execute(sql, params)
+        self._writes += 1
+        if self._writes >= self.prune_every:
+            self._prune()
+        return cursor
+
+    def _prune(self):
+        self._writes = 0
+        with self._conn:
+            expired = self._conn.execute(
+                "DELETE FROM problem_state WHERE touched < ?", (time.time() - self.ttl,)).rowcount
+            evicted = self._conn.execute("""
+                DELETE FROM problem_state WHERE session_id IN (
+                    SELECT session_id FROM problem_state ORDER BY touched DESC
+                    LIMIT -1 OFFSET ?)""", (self.max_entries,)).rowcount
+        self.expirations += expired
+        self.evictions += evicted
+
+    def elapsed(self, session_id):
+        """Seconds spent on the current problem; starts the timer if needed"""
+        now = time.time()
+        with self._lock:
+            # Restart the timer if the record is missing or has expired
+            self._write("""
+                INSERT INTO problem_state (session_id, start_time, touched) VALUES (?, ?, ?)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    start_time = CASE WHEN touched < ? THEN excluded.start_time ELSE start_time END,
+                    hint_count = CASE WHEN touched < ? THEN 0 ELSE hint_count END,
+                    problem_text = CASE WHEN touched < ? THEN NULL ELSE problem_text END,
+                    touched = excluded.touched""",
+                (session_id, now, now, now - self.ttl, now - self.ttl, now - self.ttl))
+            row = self._conn.execute(
+                "SELECT start_time FROM problem_state WHERE session_id = ?", (session_id,)).fetchone()
+        return now - row[0] if row else 0
+
+    def hint_count(self, session_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hint_count FROM problem_state WHERE session_id = ? AND touched >= ?",
+                (session_id, time.time() - self.ttl)).fetchone()
+        return row[0] if row else 0
+
+    def reset(self, session_id, problem_text=None):
+        now = time.time()
+        with self._lock:
+            self._write(
+                "INSERT OR REPLACE INTO problem_state VALUES (?, ?, 0, ?, ?)",
+                (session_id, now, problem_text, now))
+
+    def increment_hints(self, session_id):
+        """Count a hint and return the new total (0 if nothing is tracked)"""
+        now = time.time()
+        with self._lock:
+            cursor = self._write("""
+                UPDATE problem_state SET hint_count = hint_count + 1, touched = ?
+                WHERE session_id = ? AND touched >= ?""", (now, session_id, now - self.ttl))
+            if not cursor.rowcount:
+                return 0
+            row = self._conn.execute(
+                "SELECT hint_count FROM problem_state WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def remove(self, session_id):
+        with self._lock:
+            self._write("DELETE FROM problem_state WHERE session_id = ?", (session_id,))
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM problem_state").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "entries": entries,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_tutoring_state(backend, sessions_file, max_entries=10000, ttl=24 * 3600):
+    """Build the tutoring state store selected by `backend` ('memory' or 'sqlite')"""
+    if backend == 'sqlite':
+        base = os.path.splitext(sessions_file)[0]
+        return SqliteTutoringState(f"{base}_tutoring.db", max_entries=max_entries, ttl=ttl)
+    if backend == 'memory':
+        return MemoryTutoringState(max_entries=max_entries, ttl=ttl)
+    raise ValueError(f"Unknown tutoring state backend: {backend}")